@@ -1,23 +1,50 @@
+import contextlib
+import math
 import numpy as np
 import random
 import gymnasium
 import sumolib
 import time
-import traci
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from trafficlightrl.artifacts import prepared_config
+from trafficlightrl.backend import connect, load_backend, new_label
+from trafficlightrl.crop import crop_network
+from trafficlightrl.snapshot import SnapshotReset
+from trafficlightrl.metrics import MetricRegistry
+from trafficlightrl.decisions import DecisionPoints
+from trafficlightrl.demand import RandomDemand, load_schedule
+from trafficlightrl.emissions import EmissionAccounting
+from trafficlightrl.idle import IdleFastForward
+from trafficlightrl.instrumentation import Instrumentation, InstrumentedConnection
+from trafficlightrl.network import get_network_metadata
+from trafficlightrl.phases import PhaseTransitionTable
+from trafficlightrl.observation import LaneAggregateObserver, ObservationLayout, SubscriptionObserver
+from trafficlightrl.stats import RunningStats
+from trafficlightrl.vehicles import VehicleBookkeeper
 
 
 class SumoEnv(gymnasium.Env):
-  def __init__(self, use_gui=False, use_random=False, use_actions=True):
+  def __init__(self, use_gui=False, use_random=False, use_actions=True, spawn_rate=0.3, use_libsumo=True, label=None, use_snapshot=False, warmup_steps=0, use_lane_aggregates=False, info_metrics=(), use_instrumentation=False, use_sumo_demand=False, demand_seed=None, emission_pollutants=("CO2",), use_decision_points=False, min_green=10, decision_interval=30, queue_threshold=3, use_idle_fast_forward=False, step_length=1.0, use_mesosim=False, crop_radius=None, use_network_cache=True, tile_prefix=""):
     super().__init__() # Initializes the parent class
 
-    # Check if TraCI is already loaded; if so, close it
-    if traci.isLoaded():
-      traci.close()
+    # Pick the simulation backend: libsumo runs SUMO in-process (headless only), traci talks to it over a socket
+    self.backend = load_backend(use_gui=use_gui, use_libsumo=use_libsumo)
+
+    # Each env owns its own connection (self.sumo is set once the simulation is started)
+    self.label = label if label else new_label()
+    self.sumo = None
 
     # Define the Discrete action space with gymnasium.spaces.Discrete(n)
     # choices are up & down = green, or l & r = green
     self.action_space = gymnasium.spaces.Discrete(4)
+    # Action -> traffic light transitions (see perform_action for the phases), derived from the light's program once the network is loaded
+    # this intersection has no N & S left turn advance, so actions 2 and 3 both switch to N & S green
+    self.action_phases = [0, 2, 4, 4] # green phase of each action
+    self.phase_transitions = None
+    self.transition_table = None
 
     # Define the Box observation space with gymnasium.spaces.Box()
     # Note the structure of the Box parameters requires NumPy arrays!
@@ -38,23 +65,37 @@ class SumoEnv(gymnasium.Env):
       "-388930252#1_0": {"type": [1, 1, 1], "phases": [4]},  # Left-turn lane
       
     }
+
+    # tile_prefix: this env is one copy of a tiled network (see trafficlightrl.tiling), whose lane, edge and vehicle IDs carry the prefix
+    self.tile_prefix = tile_prefix
+    if tile_prefix:
+      self.lanes = {tile_prefix + lane_id: lane for lane_id, lane in self.lanes.items()}
+
     self.last_phase_change_time = { # note: each of the keys correspond to one of my end state phases
       0: 0,
       1: 0,
       2: 0,
       4: 0
     }
-    self.vehicle_emissions = {}
     self.max_wait_time = 1000
-    num_lanes=6
-    num_metrics_per_lane = 5
-    num_lane_type_features=3 # [left, straight, right] "one-hot" encoding
-    observation_size = 2 + num_lanes * (num_metrics_per_lane + num_lane_type_features)
+    # Observation layout: fixed offsets per lane, compiled once from self.lanes (size = 2 + lanes * (5 metrics + 3 lane type features))
+    self.observation_layout = ObservationLayout(self.lanes, self.last_phase_change_time.keys())
+    observation_size = self.observation_layout.size
     
     max_cars = 100 # CHANGE FOR ACTUAL MAX. NUMBER OF CARS
     self.max_cars = max_cars
     
-    self.car_spawn_rate = spawn_rate # cars spawn at 30% chance
+    self.car_spawn_rate = spawn_rate # probability that a random car spawns on each simulation step
+
+    # Routes random cars can take; start_edge: end_edge(s)
+    self.edge_mapping = {
+        "4976399#0": ["388930252#1", "28160915#2", "-4754858#0"], # East starting -> [right, straight, left]
+        "28160914#0": ["-4754858#0", "28160917#2", "388930252#1"], # West starting -> [right, straight, left]
+        "4754858#0": ["28160917#2", "388930252#1", "28160915#2"], # South starting -> [right, straight, left]
+        "-388930252#1": ["28160915#2", "-4754858#0", "28160917#2"] # North starting -> [right, straight, left]
+    }
+    if tile_prefix:
+      self.edge_mapping = {tile_prefix + start_edge: [tile_prefix + end_edge for end_edge in end_edges] for start_edge, end_edges in self.edge_mapping.items()}
 
     # np array structure: [traffic_light_phase][positions][speeds], dtype=np.float32
     self.observation_space = gymnasium.spaces.Box(
@@ -88,284 +129,398 @@ class SumoEnv(gymnasium.Env):
     self.sumo_binary = sumo_binary
     self.sumo_config = sumo_config
 
+    # crop_radius: run on the network cropped to crop_radius metres around the intersection (keeping every random car's route)
+    # instead of the whole OSM export; built once and cached, polygons only kept for sumo-gui, see crop_network
+    if crop_radius is not None:
+      self.sumo_config = crop_network(sumo_config, self.lanes, self.edge_mapping, crop_radius, keep_polygons=use_gui)
+
+    # use_network_cache: start and reset from the network artifact cache - gzipped inputs decompressed and validated once,
+    # GUI settings and polygons left out of headless runs (see prepared_config)
+    if use_network_cache:
+      self.sumo_config = prepared_config(self.sumo_config, headless=not use_gui)
+
+    # step_length: simulated seconds per simulationStep (every action, yellow and hold time is in seconds whatever the step length)
+    # use_mesosim: SUMO's mesoscopic model (queues per edge segment instead of car following) - much cheaper, e.g. for pretraining
+    # before fine-tuning on the microscopic model; lane values such as halting numbers and waiting times are coarser there
+    self.step_length = step_length
+    self.use_mesosim = use_mesosim
+
+    # SUMO-native random cars: each episode's cars go into a seeded route file that SUMO inserts itself,
+    # instead of spawn_random_car adding them through TraCI on every step (same spawn rate, routes, speeds and max_cars cap)
+    self.demand = RandomDemand(self.edge_mapping, self.car_spawn_rate, self.max_cars, self.sumo_config, self.label) if use_random and use_sumo_demand else None
+
+    # demand_seed: episode n replays the cached demand schedule for seed demand_seed + n instead of rolling random cars live,
+    # so e.g. an RL env and a fixed-time env with the same demand_seed see exactly the same cars
+    self.demand_seed = demand_seed
+    self.schedule = None
+    self.spawn_opportunity = 0
+
+    # Subscription-backed observation engine (lane and vehicle data comes back with every simulationStep)
+    # use_lane_aggregates=True builds the same features from lane-level values only (no per-vehicle data in the observation)
+    # the bookkeeper keeps the per-vehicle records (greatest wait time, emissions) of the vehicles on the controlled lanes;
+    # it subscribes each of them, so it is only built when info_metrics asks for avg_wait_time or emissions
+    # emission_pollutants: what is integrated per vehicle and per controlled lane for info["lane_emission_totals"] (any of CO2, NOx, fuel)
+    self.bookkeeper = None
+    if "avg_wait_time" in info_metrics or "emissions" in info_metrics:
+      self.bookkeeper = VehicleBookkeeper(EmissionAccounting(emission_pollutants if "emissions" in info_metrics else ()))
+    if use_lane_aggregates:
+      self.observer = LaneAggregateObserver(self.lanes.keys(), bookkeeper=self.bookkeeper, vehicle_prefix=tile_prefix)
+    else:
+      self.observer = SubscriptionObserver(self.lanes.keys(), bookkeeper=self.bookkeeper, vehicle_prefix=tile_prefix)
+
+    # Snapshot reset: restore a saved start-of-episode state instead of re-loading the network on every reset
+    self.use_snapshot = use_snapshot
+    if use_snapshot and self.demand: # a restored state holds the first episode's route file, so every episode would get the same cars
+      raise ValueError("use_snapshot cannot be combined with use_sumo_demand")
+    self.snapshot = SnapshotReset(self.label, warmup_steps=warmup_steps)
+    self.episode_count = 0 # 0-based index of the current episode: picks its demand seed and keeps route IDs unique between episodes (routes added earlier can outlive a state restore)
+
+    # Static network facts (TLS IDs, lane speeds/lengths, spawn edges), queried once per network and shared by every env in this process
+    self.network = None
+
+    # Optional TraCI call counts/latencies (per method, per step and per env phase), returned in info at episode end
+    self.instrumentation = Instrumentation() if use_instrumentation else None
+
     # Start the simulation
     self.started = False
 
-    # Track cumulative metrics
-    self.vehicle_wait_log = {}
-    self.total_congestion_log = []
-    self.total_speed_log = []
+    # Track cumulative metrics (constant memory: running means; per-vehicle records are in self.bookkeeper)
+    self.congestion_stats = RunningStats() # stopped vehicles per step
+    self.speed_stats = RunningStats() # average vehicle speed per step
+
+    # Metrics are only evaluated when the reward or the episode info asks for them (at most once per step)
+    # info_metrics lists the ones the info needs: congestion -> total_congestion_avg, avg_speed -> total_speed_avg,
+    # avg_wait_time -> wait_time_stats, emissions -> lane_emission_totals (the last two from the bookkeeper, which the observer updates every step)
+    self.metrics = MetricRegistry()
+    self.metrics.register("vehicle_ids", lambda: self.sumo.vehicle.getIDList() if not self.tile_prefix else [v_id for v_id in self.sumo.vehicle.getIDList() if v_id.startswith(self.tile_prefix)])
+    self.metrics.register("congestion", lambda: self.calculate_congestion(self.metrics.get("vehicle_ids")))
+    self.metrics.register("avg_wait_time", lambda: self.calculate_avg_wait_time(self.lanes.keys()))
+    self.metrics.register("total_stops", lambda: self.calculate_total_stops(self.lanes.keys()))
+    self.metrics.register("avg_speed", lambda: self.calculate_avg_speed(self.metrics.get("vehicle_ids")))
+    self.metrics.register("emissions", lambda: self.bookkeeper.emissions.mean_per_vehicle("CO2"))
+    # the reward only reads the lane subscriptions, so by default none is evaluated (congestion and avg_speed query
+    # every vehicle in the network each step) and the episode metrics in the info stay None
+    self.info_metrics = info_metrics
 
     # use actions argument: False = use the timer based system instead (for comparing between agent and real-life)
     self.use_actions = use_actions
 
+    # use_decision_points: only ask the agent for an action at decision points (minimum green elapsed, queue change beyond
+    # queue_threshold, every decision_interval seconds) and fast-forward the simulation in between, see DecisionPoints
+    self.decision_points = DecisionPoints(min_green, decision_interval, queue_threshold) if use_decision_points else None
+
+    # use_idle_fast_forward: while the network is empty, jump to the step before the next departure in one simulationStep() call
+    # (needs the next random car in advance: use_sumo_demand or demand_seed), see fast_forward_idle
+    self.idle_fast_forward = IdleFastForward(self.sumo_config) if use_idle_fast_forward else None
+
     # Define consistent pause time for sumo-gui visualization
     self.pause_time = 0.35
 
+  def start_simulation(self):
+    # Launch SUMO on this env's own labelled connection (free port picked automatically, so many envs can run side by side)
+    self.sumo = connect(self.backend, [self.sumo_binary, "--start"] + self.simulation_args(), label=self.label)
+    if self.instrumentation:
+      self.sumo = InstrumentedConnection(self.sumo, self.instrumentation)
+    self.started = True
+    self.attach_simulation(self.sumo)
+
+  def attach_simulation(self, conn):
+    # Set this env up on a running simulation: the one start_simulation launched, or the shared one of a tiled network
+    self.sumo = conn
+    self.network = get_network_metadata(self.sumo, self.sumo_config, self.lanes, self.edge_mapping.keys())
+    self.traffic_light_id = self.network.traffic_light_id
+    traffic_light_id = self.traffic_light_id # MAKE SURE TO MODIFY IF YOUR INTERSECTION CONTAINS >1 TRAFFIC LIGHT
+    if not self.transition_table: # this light's transitions, with the phase durations of its program
+      self.transition_table = PhaseTransitionTable(self.action_phases, self.network.traffic_light_program(self.sumo, traffic_light_id), self.phase_transitions, self.step_length)
+    self.sumo.trafficlight.setPhase(traffic_light_id, 0)
+        # Ensure light phases are all manually controlled
+
+    if self.use_actions:
+      self.sumo.trafficlight.setPhaseDuration(traffic_light_id, 99999)  # Hold this phase indefinitely
+
+    # Save the start-of-episode state once so later resets can restore it
+    if self.use_snapshot:
+      self.snapshot.save(self.sumo)
+
+    self.load_episode_schedule()
+
+    # Register the observation subscriptions for this episode
+    self.observer.subscribe(self.sumo, traffic_light_id)
+
+  def simulation_args(self):
+    # SUMO options for a new episode (with use_sumo_demand, plus the route file with this episode's random cars)
+    args = ["-c", self.sumo_config, "--step-length", str(self.step_length)]
+    if self.use_mesosim: # junction control keeps the traffic light in charge of the flow
+      args += ["--mesosim", "true", "--meso-junction-control", "true"]
+    if self.demand:
+      args += self.demand.write(self.episode_seed())
+    return args
+
+  def episode_seed(self):
+    # seed of this episode's random cars
+    if self.demand_seed is not None:
+      return self.demand_seed + self.episode_count
+    return int(self.np_random.integers(2**31 - 1))
+
+  def load_episode_schedule(self):
+    # with demand_seed (and per-step spawning), pick this episode's cached schedule and rewind it
+    if self.use_random and not self.demand and self.demand_seed is not None:
+      self.schedule = load_schedule(self.edge_mapping, self.car_spawn_rate, self.max_cars, self.episode_seed())
+      self.spawn_opportunity = 0
+
+  def spawn_cars(self):
+    # one spawn opportunity: replay the cached schedule if there is one, otherwise roll against the spawn rate
+    if self.schedule is not None:
+      spawn = self.deployed_counter < self.max_cars and self.schedule["depart"][self.deployed_counter] == self.spawn_opportunity
+      self.spawn_opportunity += 1
+    else:
+      spawn = (random.random() < self.car_spawn_rate) and (self.deployed_counter < self.max_cars)
+
+    if spawn:
+      self.spawn_random_car(self.deployed_counter)
+      self.deployed_counter += 1
+
+  def fast_forward_idle(self):
+    # runs the steps up to the next departure in one call while nothing is on the network; returns the number of steps skipped
+    if any(self.observer.vehicle_count(lane_id) for lane_id in self.observer.lane_ids):
+      return 0
+    current_time = self.observer.time()
+    step_length = self.observer.step_length()
+    if not self.use_random:
+      spawn_steps = math.inf
+    elif self.demand:
+      spawn_steps = self.demand.idle_steps(current_time, step_length)
+    elif self.schedule is not None:
+      spawn_steps = int(self.schedule["depart"][self.deployed_counter]) - self.spawn_opportunity if self.deployed_counter < self.max_cars else math.inf
+    else: # live random spawning: the next car is not known in advance
+      return 0
+
+    steps = self.idle_fast_forward.steps(self.sumo, current_time, step_length, spawn_steps)
+    if not steps:
+      return 0
+    self.sumo.simulationStep(current_time + steps * step_length)
+    if self.schedule is not None: # every skipped step was a spawn opportunity without a car
+      self.spawn_opportunity += steps
+
+    # the skipped steps repeat the empty state: every vehicle metric (and so the reward) is 0 and the light holds its phase
+    current_phase = self.observer.phase()
+    for phase in self.last_phase_change_time:
+      if phase != current_phase:
+        self.last_phase_change_time[phase] += steps * self.step_length
+    for metric_name, stats in (("congestion", self.congestion_stats), ("avg_speed", self.speed_stats)):
+      if metric_name in self.info_metrics:
+        stats.add(0, count=steps)
+    return steps
+
+  def timed(self, phase):
+    # attributes the TraCI calls made inside the block to an env phase (no-op unless use_instrumentation)
+    return self.instrumentation.phase(phase) if self.instrumentation else contextlib.nullcontext()
+
   def step(self, action):
     # On first step, start the traci sim
     if not self.started:
-      traci.start([self.sumo_binary, "--start", "-c", self.sumo_config], port=8803)
-      self.started = True
-      traffic_light_id = traci.trafficlight.getIDList()[0] # MAKE SURE TO MODIFY IF YOUR INTERSECTION CONTAINS >1 TRAFFIC LIGHT
-      traci.trafficlight.setPhase(traffic_light_id, 0)
-          # Ensure light phases are all manually controlled
-
-      if self.use_actions:
-        traci.trafficlight.setPhaseDuration(traffic_light_id, 99999)  # Hold this phase indefinitely
+      self.start_simulation()
     
+    if self.instrumentation:
+      self.instrumentation.new_step()
+
     # Perform the action
     if self.use_actions:
-      self.perform_action(action)
+      with self.timed("perform_action"):
+        self.perform_action(action)
     
-    # Spawn in a car if suits the spawn rate on step
-    if self.use_random:
-      if (random.random() < self.car_spawn_rate) and (self.deployed_counter < self.max_cars):
-        self.spawn_random_car(self.deployed_counter)
-        self.deployed_counter += 1
+    # Advance to the agent's next decision: a single simulation step, or with use_decision_points every step up to the
+    # next decision point (the reward is accumulated over them)
+    reward = 0
+    decision_steps = 0
+    skipped_time = 0
+    while True:
+      # Nothing on the network: jump over the steps before the next departure in one call
+      if self.idle_fast_forward:
+        with self.timed("idle_fast_forward"):
+          skipped_steps = self.fast_forward_idle()
+        decision_steps += skipped_steps
+        skipped_time += skipped_steps * self.observer.step_length()
+
+      # Spawn in a car if suits the spawn rate on step (SUMO inserts them itself with use_sumo_demand)
+      if self.use_random and not self.demand:
+        with self.timed("spawn_random_car"):
+          self.spawn_cars()
   
 
-    # Advance the simulation by one step
-    traci.simulationStep()
-    if self.use_gui: # pause in between steps to slow down if in 'simulation mode'
-      time.sleep(self.pause_time) 
-    #print("Step: " + str(traci.simulation.getTime()))
-    # Get the new state
-    observation = self.get_state()
-
-    # Calculate the reward
-    reward = self.calculate_reward()
-
-    # Determine if simulation is done
-    done = self.is_done()
+      # Advance the simulation by one step
+      with self.timed("simulation_step"):
+        self.sumo.simulationStep()
+      if self.use_gui: # pause in between steps to slow down if in 'simulation mode'
+        time.sleep(self.pause_time) 
+      self.metrics.new_step()
+      #print("Step: " + str(traci.simulation.getTime()))
+      # Get the new state
+      with self.timed("get_state"):
+        observation = self.get_state()
+
+      # Calculate the reward
+      with self.timed("calculate_reward"):
+        reward += self.calculate_reward()
+
+      # Evaluate the metrics the episode info is built from (each one updates its own log)
+      with self.timed("info_metrics"):
+        for metric_name in self.info_metrics:
+          self.metrics.get(metric_name)
+
+      # Determine if simulation is done
+      if self.demand: # count the route-file cars whose departure time has passed
+        self.deployed_counter = self.demand.deployed_count(self.observer.time())
+      with self.timed("is_done"):
+        done = self.is_done()
+      decision_steps += 1
+      if done or not self.decision_points or self.decision_points.is_decision_point(self.observer.time(), self.observer.phase(), self.metrics.get("total_stops")):
+        break
 
     # Set placeholder for info -> returns the tracked cumulative metrics IF done
-    info = {
-      "vehicle_wait_log": self.vehicle_wait_log if done else None,
-      "total_congestion_avg": (sum(self.total_congestion_log) / len(self.total_congestion_log)) if done and self.total_congestion_log else None,
-      "total_speed_avg": (sum(self.total_speed_log) / len(self.total_speed_log)) if done and self.total_speed_log else None
-    }
+    info = self.step_info(done)
+    info["decision_steps"] = decision_steps # simulation steps since the last decision (after the action's own transition)
+    info["skipped_time"] = skipped_time # simulated seconds of those that were fast-forwarded over an empty network
 
     # Set placeholder for truncated
     truncated = False
 
-    # set 'observation' to a numpy array
-    observation = np.array(observation, dtype=np.float32)
-
     # Return step information (MUST follow this order of variables!!!)
     return observation, reward, done, truncated, info
 
+  def step_info(self, done):
+    # the tracked cumulative metrics, returned at the end of an episode
+    return {
+      "wait_time_stats": self.bookkeeper.wait_time_stats.summary() if done and "avg_wait_time" in self.info_metrics else None, # count/mean/std/min/max/percentiles over vehicles
+      "total_congestion_avg": self.congestion_stats.mean if done and self.congestion_stats.count else None,
+      "total_speed_avg": self.speed_stats.mean if done and self.speed_stats.count else None,
+      "lane_emission_totals": self.bookkeeper.emissions.summary() if done and "emissions" in self.info_metrics else None, # mg per episode on the controlled lanes: total, per vehicle, per lane
+      "traci_stats": self.instrumentation.summary() if done and self.instrumentation else None
+    }
+
   def render(self):
     # render needs to exist in the Gymnasium env, as it is an essential aspect
     # however we might not need to put anything inside it, hence 'pass'
     # this depends on if the command -> traci.simulationStep() exists somewhere else in the Class
     pass
 
+  def close(self):
+    # shut down the simulation (whichever backend is running it)
+    if self.started:
+      self.sumo.close()
+      self.started = False
+    self.snapshot.cleanup()
+    if self.demand:
+      self.demand.cleanup()
+
   def reset(self, seed=None, options=None):
 
     # resets the gymnasium.Env parent class
     super().reset(seed=seed)
+    if self.instrumentation: # stats in info cover one episode (including this reset)
+      self.instrumentation.reset()
+    if self.started: # the first episode is 0 whether reset() or step() starts the simulation
+      self.episode_count += 1
 
     # close the simulation (reset)
-    if not self.use_gui: # traci.load() doesn't work for sumo-gui - i.e. can only run once
-      traci.load(["-c", self.sumo_config])
+    if not self.started: # vectorized envs call reset() before the first step
+      self.start_simulation()
+    elif self.use_snapshot: # restoring the saved state skips re-parsing the network (and also works in sumo-gui)
+      self.snapshot.restore(self.sumo)
+      self.observer.subscribe(self.sumo, self.traffic_light_id)
+    elif not self.use_gui: # traci.load() doesn't work for sumo-gui - i.e. can only run once
+      self.sumo.load(self.simulation_args())
+      self.observer.subscribe(self.sumo, self.traffic_light_id) # loading drops every subscription
 
     # reset counter variables
     if self.use_random:
       self.deployed_counter = 0
     else:
       self.deployed_counter = 1
+    self.load_episode_schedule()
+
+    # the episode statistics in info cover one episode (the bookkeeper is reset when the observer subscribes)
+    self.congestion_stats.reset()
+    self.speed_stats.reset()
+
+    # get_state already returns a float32 NumPy array
+    observation = self.get_state()
 
-    # convert 'observation' to a NumPy array
-    observation = np.array(self.get_state(), dtype=np.float32)
+    if self.decision_points: # the episode starts at a decision point
+      self.decision_points.reset(self.observer.time(), self.observer.phase(), self.calculate_total_stops(self.lanes.keys()))
 
     # return 'observation' and 'info' --> MUST be in this form
     return observation, {}
 
   def get_state(self):
-    # Define a speed threshold for "stopped" vehicles
-    speed_threshold = 0.1  # Vehicles with speed < 0.1 m/s are considered stopped
-
-    state = []
+    # the observation is written in place into the preallocated buffer (layout compiled from self.lanes in __init__)
+    state = self.observation_layout.buffer
+    lane_rows = self.observation_layout.lane_rows
 
     # 1. Traffic light phase (normalized to [0, 1])
-    traffic_light_phase = traci.trafficlight.getPhase(traci.trafficlight.getIDList()[0])
-    state.append(traffic_light_phase / 9.0)  # Normalize phase to [0, 1]
+    self.observer.update(self.sumo)
+    traffic_light_phase = self.observer.phase()
+    state[0] = traffic_light_phase / 9.0  # Normalize phase to [0, 1]
     for phase_change_time in self.last_phase_change_time:
       if phase_change_time == traffic_light_phase:
         self.last_phase_change_time[phase_change_time] = 0
       else:
-        self.last_phase_change_time[phase_change_time] += 1
+        self.last_phase_change_time[phase_change_time] += self.step_length # seconds, like the simulation time in state[1]
 
     # 2. Time since last phase change (normalized to [0, 1])
-    current_time = traci.simulation.getTime()
+    current_time = self.observer.time()
     time_since_last_change = current_time - min(self.last_phase_change_time.values())
-    state.append(time_since_last_change / self.max_wait_time)  # Normalize using max_wait_time
+    state[1] = time_since_last_change / self.max_wait_time  # Normalize using max_wait_time
 
     # 3. Per-lane metrics (only for lanes directly connected to the intersection)
-    for lane_id, lane_info in self.lanes.items():
-        vehicle_ids = traci.lane.getLastStepVehicleIDs(lane_id)
-
-        # Number of vehicles (normalized to [0, 1])
-        num_vehicles = len(vehicle_ids)
-        state.append(num_vehicles / self.max_cars)
-
-        # Queue length (number of vehicles with speed < threshold, normalized to [0, 1])
-        queue_length = sum(1 for v_id in vehicle_ids if traci.vehicle.getSpeed(v_id) < speed_threshold)
-        state.append(queue_length / self.max_cars)
+    for i, lane_id in enumerate(self.observation_layout.lane_ids):
+        num_vehicles, queue_length, total_wait_time, avg_speed = self.observer.lane_metrics(lane_id)
 
-        # Total wait time (normalized to [0, 1])
-        total_wait_time = sum(traci.vehicle.getWaitingTime(v_id) for v_id in vehicle_ids)
-        state.append(total_wait_time / self.max_wait_time)  # Normalize using max_wait_time
+        lane_rows[i, :4] = (
+          num_vehicles / self.max_cars, # Number of vehicles (normalized to [0, 1])
+          queue_length / self.max_cars, # Queue length (number of vehicles with speed < threshold, normalized to [0, 1])
+          total_wait_time / self.max_wait_time, # Total wait time (normalized using max_wait_time)
+          avg_speed / self.network.lane_max_speeds[lane_id] # Average speed (normalized to [0, 1])
+        )
 
-        # Average speed (normalized to [0, 1])
-        avg_speed = np.mean([traci.vehicle.getSpeed(v_id) for v_id in vehicle_ids]) if vehicle_ids else 0
-        state.append(avg_speed / traci.lane.getMaxSpeed(lane_id))  # Normalize to [0, 1]
+    # Time since last visited (all lanes at once); the one-hot lane type columns were written once at init
+    lane_rows[:, 4] = self.observation_layout.time_since_visited(self.last_phase_change_time)
 
-        # Time since last visited  
-        minn = float("inf")
-        for phase in lane_info["phases"]:
-          if self.last_phase_change_time[phase] < minn:
-            minn = self.last_phase_change_time[phase]
-        state.append(minn / float(max(self.last_phase_change_time.values())))
-
-        # Lane type (one-hot encoded)
-        lane_type = lane_info["type"]
-        state.extend(lane_type)
-
-    return np.array(state, dtype=np.float32)
+    return state.copy() # the buffer is reused next step
 
   def perform_action(self, action):
-
-
-    light_id = traci.trafficlight.getIDList()[0]
-    current_phase = traci.trafficlight.getPhase(light_id)
-
     """
-    Phases: 
-      (0) E & W = green, N & S = red
-      (1) E & W = yellow, N & S = red, WITH left turns still active (to allow cars to leave intersection)
+    Phases (the light's program in queens.net.xml):
+      (0) E & W = green (left turns permitted), N & S = red
+      (1) E & W = yellow, E & W left turns still green
       (2) E & W LEFT TURNING LANES ONLY = green, everything else = red
       (3) E & W LEFT TURNING LANES ONLY = yellow, everything else = red
-      (4) ALL RED
-      (5) N & S = green (including left turn lanes), E & W = red
-      (6) N & S LEFT TURNING LANES = green, N & S EVERYTHING ELSE = yellow, E & W = red (allows cars turning left to exit)
-      (7) N & S LEFT TURNING LANES ONLY = green, N & S EVERYTHING ELSE = red, E & W = red
-      (8) N & S LEFT TURNING LANES ONLY = yellow, N & S EVERYTHING ELSE = red, E & W = red
-      (9) ALL RED
-      note (4) and (9) are duplicate states
+      (4) N & S = green (left turns permitted), E & W = red
+      (5) N & S = yellow, E & W = red
 
       Define action 0 as switching to green E & W ALL
       Define action 1 as switching to green E & W left turn advance
-      Define action 2 as switching to green N & S left turn advance
+      Define action 2 as switching to green N & S (there is no N & S left turn advance here)
       Define action 3 as switching to green N & S ALL
 
+      The yellow phases in between come from the program (see trafficlightrl.phases.program_transitions)
     """
-
-    if action == 0 and current_phase != 0:
-      if current_phase == 2:
-        traci.trafficlight.setPhase(light_id, 3)  # transition to yellow
-      elif current_phase == 7:
-        traci.trafficlight.setPhase(light_id,  8)
-      elif current_phase == 5:
-        traci.trafficlight.setPhase(light_id, 6)
-        traci.trafficlight.setPhaseDuration(light_id, 3)
-        self.skip_steps(3)
-        traci.trafficlight.setPhase(light_id, 8)
-      traci.trafficlight.setPhaseDuration(light_id, 3)
-      self.skip_steps(3) # ensure light is green for at least 3 seconds
-      traci.trafficlight.setPhase(light_id, 4)
-      traci.trafficlight.setPhaseDuration(light_id, 2)
-      self.skip_steps(2)
-      traci.trafficlight.setPhase(light_id, 0)  # set E-W green
-      traci.trafficlight.setPhaseDuration(light_id, 99999)  # Hold this phase indefinitely
-      self.skip_steps(5) # ensure light is green for at least 3 seconds
-      #print("Set to phase 0")
-      #self.last_phase_change_time = traci.simulation.getTime()
-    
-    elif action == 1 and current_phase != 2:
-      if current_phase == 0:
-        traci.trafficlight.setPhase(light_id, 1)  # transition to yellow
-        traci.trafficlight.setPhaseDuration(light_id, 3)
-        self.skip_steps(3)
-        traci.trafficlight.setPhase(light_id, 3)
-      elif current_phase == 7:
-        traci.trafficlight.setPhase(light_id,  8)
-      elif current_phase == 5:
-        traci.trafficlight.setPhase(light_id, 6)
-        traci.trafficlight.setPhaseDuration(light_id, 3)
-        self.skip_steps(3)
-        traci.trafficlight.setPhase(light_id, 8)
-      traci.trafficlight.setPhaseDuration(light_id, 3)
-      self.skip_steps(3) # ensure light is green for at least 3 seconds
-      traci.trafficlight.setPhase(light_id, 4)
-      traci.trafficlight.setPhaseDuration(light_id, 2)
-      self.skip_steps(2)
-      traci.trafficlight.setPhase(light_id, 2)  # set N-S green
-      traci.trafficlight.setPhaseDuration(light_id, 99999)  # Hold this phase indefinitely
-      self.skip_steps(5)
-      #print("Set to phase 2")
-      #self.last_phase_change_time = traci.simulation.getTime()
-    
-    elif action == 2 and current_phase != 7:
-      if current_phase == 2:
-        traci.trafficlight.setPhase(light_id, 3)  # transition to yellow
-      elif current_phase == 0:
-        traci.trafficlight.setPhase(light_id,  1)
-        traci.trafficlight.setPhaseDuration(light_id, 3)
-        self.skip_steps(3)
-        traci.trafficlight.setPhase(light_id, 3)
-      elif current_phase == 5:
-        traci.trafficlight.setPhase(light_id, 6)
-        traci.trafficlight.setPhaseDuration(light_id, 3)
-        self.skip_steps(3)
-        traci.trafficlight.setPhase(light_id, 8)
-      traci.trafficlight.setPhaseDuration(light_id, 3)
-      self.skip_steps(3) # ensure light is green for at least 3 seconds
-      traci.trafficlight.setPhase(light_id, 4)
-      traci.trafficlight.setPhaseDuration(light_id, 2)
-      self.skip_steps(2)
-      traci.trafficlight.setPhase(light_id, 7)  # set N-S green
-      traci.trafficlight.setPhaseDuration(light_id, 99999)  # Hold this phase indefinitely
-      self.skip_steps(5)
-      #self.last_phase_change_time = traci.simulation.getTime()
-
-    elif action == 3 and current_phase != 5:
-      if current_phase == 2:
-        traci.trafficlight.setPhase(light_id, 3)  # transition to yellow
-      elif current_phase == 7:
-        traci.trafficlight.setPhase(light_id,  8)
-      elif current_phase == 0:
-        traci.trafficlight.setPhase(light_id, 1)
-        traci.trafficlight.setPhaseDuration(light_id, 3)
-        self.skip_steps(3)
-        traci.trafficlight.setPhase(light_id, 3)
-      traci.trafficlight.setPhaseDuration(light_id, 3)
-      self.skip_steps(3) # ensure light is green for at least 3 seconds
-      traci.trafficlight.setPhase(light_id, 4)
-      traci.trafficlight.setPhaseDuration(light_id, 2)
-      self.skip_steps(2)
-      traci.trafficlight.setPhase(light_id, 5)  # set N-S green
-      traci.trafficlight.setPhaseDuration(light_id, 99999)  # Hold this phase indefinitely
-      self.skip_steps(5)
-      #self.last_phase_change_time = traci.simulation.getTime()
-    
+    # the phase changes for (current phase, action) were compiled in start_simulation;
+    # the current phase comes from the traffic light subscription
+    self.transition_table.execute(self.sumo, self.traffic_light_id, self.observer.phase(), action, self.skip_steps)
 
   def calculate_reward(self):
     # REWARD FUNCTION: Calculate the reward (should be negative if in a poor state i.e. high congestion)
-    lane_ids = self.lanes.keys()
-    vehicle_ids = traci.vehicle.getIDList()
-    light_id = traci.trafficlight.getIDList()[0]
-    current_phase = traci.trafficlight.getPhase(light_id)
+    current_phase = self.observer.phase()
     reward = 0
     try:
 
       for lane in self.lanes.keys():
         if current_phase in self.lanes[lane]["phases"]:
-          reward += len(traci.lane.getLastStepVehicleIDs(lane))
+          reward += self.observer.vehicle_count(lane)
 
         else:
-          cur_wait_time = traci.lane.getWaitingTime(lane)
+          cur_wait_time = self.observer.waiting_time(lane)
           cur_phases = self.lanes[lane]["phases"]
           min_phase = cur_phases[0]
           for j in range(1, len(cur_phases)):
@@ -373,10 +528,8 @@ class SumoEnv(gymnasium.Env):
               min_phase = cur_phases[j]
           reward -= cur_wait_time * (self.last_phase_change_time[min_phase] / max(self.last_phase_change_time.values()))
 
-      congestion = self.calculate_congestion(vehicle_ids)
-      wait_time = self.calculate_avg_wait_time(lane_ids)
-      stops = self.calculate_total_stops(lane_ids)
-      avg_speed = self.calculate_avg_speed(vehicle_ids)# -> would be maximize so don't multiply by -1
+      # combined reward (disabled) - its terms are available lazily through self.metrics.get(...):
+      # congestion, avg_wait_time, total_stops, avg_speed (avg_speed would be maximized so don't multiply by -1)
       #reward = -1*(0.5*congestion + 0.8*wait_time + stops) + 0.75*avg_speed # minimize all terms
 
     except:
@@ -388,161 +541,152 @@ class SumoEnv(gymnasium.Env):
 
   def skip_steps(self, x):
     for _ in range(x): 
-      if self.use_random:
-        if (random.random() < self.car_spawn_rate) and (self.deployed_counter < self.max_cars):
-          self.spawn_random_car(self.deployed_counter)
-          self.deployed_counter += 1
+      if self.use_random and not self.demand:
+        self.spawn_cars()
     
 
       # Advance the simulation by one step
-      traci.simulationStep()
+      self.sumo.simulationStep()
+      self.observer.update(self.sumo) # vehicles departing in this step are only reported now
       if self.use_gui: # pause in between steps to slow down if in 'simulation mode'
         time.sleep(self.pause_time)
 
   def is_done(self):
     max_time = self.max_wait_time  # Example maximum simulation time
-    return (traci.simulation.getTime() >= max_time or len(traci.vehicle.getIDList()) == 0) and self.deployed_counter >= self.max_cars -1
+    return (self.observer.time() >= max_time or len(self.metrics.get("vehicle_ids")) == 0) and self.deployed_counter >= self.max_cars -1
 
 
   # METRICS:
   def calculate_congestion(self, vehicle_ids):
     congestion = 0
-    current_time = traci.simulation.getTime()  # Get the current simulation time
+    current_time = self.sumo.simulation.getTime()  # Get the current simulation time
     
     for vehicle_id in vehicle_ids:
-      departure_time = traci.vehicle.getDeparture(vehicle_id)  # Get each vehicle's departure time
-      speed = traci.vehicle.getSpeed(vehicle_id)  # Get the vehicle's current speed
+      departure_time = self.sumo.vehicle.getDeparture(vehicle_id)  # Get each vehicle's departure time
+      speed = self.sumo.vehicle.getSpeed(vehicle_id)  # Get the vehicle's current speed
       
       # Check if the vehicle is stopped and not just starting/departing
       if speed == 0 and current_time not in range(int(departure_time) - 1, int(departure_time) + 2):
           congestion += 1  # Increment congestion counter for stopped vehicles
   
-    # update congestion log
-    self.total_congestion_log.append(congestion)
+    # update congestion stats
+    self.congestion_stats.add(congestion)
 
     return congestion
 
   def calculate_avg_wait_time(self, lane_ids):
-    wait_times = []
-    
-    # total wait time of cars in all lanes
-    for lane_id in lane_ids:
-      # total wait time of all cars in one lane
-      for vehicle_id in traci.lane.getLastStepVehicleIDs(lane_id):
-          wait_time = traci.vehicle.getWaitingTime(vehicle_id)
-
-          # update the wait log
-          if vehicle_id in self.vehicle_wait_log:
-            self.vehicle_wait_log[vehicle_id] = max(self.vehicle_wait_log[vehicle_id], wait_time) # only want the greatest average wait time for each vehicle
-          else:
-            self.vehicle_wait_log[vehicle_id] = wait_time
-
-          wait_times.append(wait_time)
-  
-    avg_wait_time = sum(wait_times)/len(wait_times) if wait_times else 0
+    # the lanes' summed waiting times over their vehicle counts (both subscribed by the observer)
+    # the greatest wait time of each vehicle is kept by self.bookkeeper
+    total_wait_time = sum(self.observer.waiting_time(lane_id) for lane_id in lane_ids)
+    num_vehicles = sum(self.observer.vehicle_count(lane_id) for lane_id in lane_ids)
+    avg_wait_time = total_wait_time / num_vehicles if num_vehicles else 0
     
     return avg_wait_time
 
   def calculate_total_stops(self, lane_ids):
     total_stops = 0
     for lane_id in lane_ids:
-      stops_in_lane = traci.lane.getLastStepHaltingNumber(lane_id)
+      stops_in_lane = self.observer.halting_number(lane_id)
       total_stops += stops_in_lane
 
     return total_stops
     
   def calculate_avg_speed(self, vehicle_ids):
-    total_speed = sum(traci.vehicle.getSpeed(v_id) for v_id in vehicle_ids)
+    total_speed = sum(self.sumo.vehicle.getSpeed(v_id) for v_id in vehicle_ids)
     avg_speed = total_speed / len(vehicle_ids) if vehicle_ids else 0
 
-    # update total speed log
-    self.total_speed_log.append(avg_speed)
+    # update speed stats
+    self.speed_stats.add(avg_speed)
 
     return avg_speed
 
   def spawn_random_car(self, step_counter):
     """
     Spawns a random car with a unique ID and assigns it a random route.
-    edge_mapping represents the available routes that any car can take; start_edge:end_edge
+    self.edge_mapping represents the available routes that any car can take; start_edge:end_edge
     """
-    edge_mapping = {
-        "183330267": ["401622262", "156268074", "-864501901#0"], # East starting -> [right, stright, left]
-        "150872238#0": ["-864501901#0", "262794389#4", "401622262"], # West starting -> [right, straight, left]
-        "864501901#0": ["262794389#4", "401622262", "156268074"], # South starting -> [right, straight, left]
-        "401622246#0": ["156268074", "-864501901#0", "262794389#4"] # North starting -> [left, straight, right]
-    }
     vehicle_id = f"rand_car_{step_counter}"
+    if self.tile_prefix: # copies of a tiled network restart their episodes while the simulation runs on
+      vehicle_id = f"{self.tile_prefix}{self.episode_count}_{vehicle_id}"
 
-    start_edge = random.choice(list(edge_mapping.keys()))
-    end_edge = random.choice(edge_mapping[start_edge])
+    if not self.network.spawn_edges: # none of the start edges exist in this network
+      return
 
-    route_id = f"route_{vehicle_id}"
+    if self.schedule is not None: # replay the cached demand schedule
+      _, start, end, speed = self.schedule[step_counter].tolist()
+      start_edge = list(self.edge_mapping)[start]
+      end_edge = self.edge_mapping[start_edge][end]
+    else:
+      start_edge = random.choice(self.network.spawn_edges)
+      end_edge = random.choice(self.edge_mapping[start_edge])
+      speed = random.uniform(5, 15)
+
+    route_id = f"route_{self.episode_count}_{vehicle_id}"
 
     try:
-        traci.route.add(routeID=route_id, edges=[start_edge, end_edge])
+        self.sumo.route.add(routeID=route_id, edges=[start_edge, end_edge])
 
         # Add the vehicle to the simulation
-        traci.vehicle.add(vehID=vehicle_id, routeID=route_id)
+        self.sumo.vehicle.add(vehID=vehicle_id, routeID=route_id)
 
         #print(f"Deployed random vehicle {vehicle_id} from {start_edge} to {end_edge}")
 
         # Set a random speed for the vehicle
-        traci.vehicle.setSpeed(vehicle_id, random.uniform(5, 15))
+        self.sumo.vehicle.setSpeed(vehicle_id, speed)
 
-    except traci.TraCIException as e:
+    except self.backend.TraCIException as e:
         pass
         #print(f"Failed to add vehicle {vehicle_id} on route from {start_edge} to {end_edge}: {e}")
 
 
 
-env = SumoEnv(use_gui=True, use_random=True, use_actions=False) # use_gui=False sets sumo_binary to 'sumo' instead of 'sumo-gui'
+if __name__ == "__main__":
+  env = SumoEnv(use_gui=True, use_random=True, use_actions=False, info_metrics=("congestion", "avg_wait_time", "avg_speed")) # use_gui=False sets sumo_binary to 'sumo' instead of 'sumo-gui'
 
-episodes = 1 # note can only be run ONCE with sumo-gui!
-score_log = []
-wait_log = []
+  episodes = 1 # note can only be run ONCE with sumo-gui!
+  score_log = []
+  wait_log = []
 
-congestion_log = []
-speed_log = []
-emissions_log = []
+  congestion_log = []
+  speed_log = []
+  emissions_log = []
 
-for episode in range(1, episodes + 1):
-    done = False
-    truncated = False
-    score = 0
-    info = {}
-
-    while not done:
-        env.render()
-        action = env.action_space.sample()
-        state, reward, done, truncated, info = env.step(action)
-        score += reward
-
-    state, info = env.reset()
-    score_log.append(score)
-
-    # Extract wait time metrics
-    wait_times = info.get("vehicle_wait_log", {}).values()
-    total_wait_time = sum(wait_times)
-    num_cars = len(wait_times)
-    episode_mean_wait = total_wait_time / num_cars if num_cars > 0 else 0
-    wait_log.append(episode_mean_wait)
-
-    # Extract congestion and speed metrics
-    if info.get("total_congestion_avg") is not None:
-        congestion_log.append(info["total_congestion_avg"])
-    if info.get("total_speed_avg") is not None:
-        speed_log.append(info["total_speed_avg"])
-
-traci.close()
-
-# Compute and print final metrics
-mean_sample_score = np.mean(score_log)
-mean_wait_time = np.mean(wait_log)
-mean_congestion = np.mean(congestion_log) if congestion_log else None
-mean_speed = np.mean(speed_log) if speed_log else None
-
-
-print(f"Mean Score over {episodes} episodes: {mean_sample_score}")
-print(f"Mean wait time over {episodes} episodes: {mean_wait_time}")
-print(f"Mean congestion over {episodes} episodes: {mean_congestion}")
-print(f"Mean speed over {episodes} episodes: {mean_speed}")
\ No newline at end of file
+  for episode in range(1, episodes + 1):
+      done = False
+      truncated = False
+      score = 0
+      info = {}
+
+      while not done:
+          env.render()
+          action = env.action_space.sample()
+          state, reward, done, truncated, info = env.step(action)
+          score += reward
+
+      state, info = env.reset()
+      score_log.append(score)
+
+      # Extract wait time metrics
+      wait_time_stats = info.get("wait_time_stats")
+      episode_mean_wait = wait_time_stats["mean"] if wait_time_stats else 0
+      wait_log.append(episode_mean_wait)
+
+      # Extract congestion and speed metrics
+      if info.get("total_congestion_avg") is not None:
+          congestion_log.append(info["total_congestion_avg"])
+      if info.get("total_speed_avg") is not None:
+          speed_log.append(info["total_speed_avg"])
+
+  env.close()
+
+  # Compute and print final metrics
+  mean_sample_score = np.mean(score_log)
+  mean_wait_time = np.mean(wait_log)
+  mean_congestion = np.mean(congestion_log) if congestion_log else None
+  mean_speed = np.mean(speed_log) if speed_log else None
+
+
+  print(f"Mean Score over {episodes} episodes: {mean_sample_score}")
+  print(f"Mean wait time over {episodes} episodes: {mean_wait_time}")
+  print(f"Mean congestion over {episodes} episodes: {mean_congestion}")
+  print(f"Mean speed over {episodes} episodes: {mean_speed}")
@@ -1,23 +1,75 @@
 
+import contextlib
+import math
 import numpy as np
 import random
 import gymnasium
-import traci
 import sumolib
 import time
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from trafficlightrl.artifacts import prepared_config
+from trafficlightrl.backend import connect, load_backend, new_label
+from trafficlightrl.crop import crop_network
+from trafficlightrl.decisions import DecisionPoints
+from trafficlightrl.demand import RandomDemand, load_schedule
+from trafficlightrl.emissions import EmissionAccounting
+from trafficlightrl.idle import IdleFastForward
+from trafficlightrl.instrumentation import Instrumentation, InstrumentedConnection
+from trafficlightrl.network import get_network_metadata
+from trafficlightrl.phases import PhaseTransitionTable
+from trafficlightrl.observation import SubscriptionObserver, VEHICLE_VARIABLES
+from trafficlightrl.snapshot import SnapshotReset
+from trafficlightrl.stats import RunningStats
+from trafficlightrl.vehicles import VehicleBookkeeper
+from traci import constants as tc
 
 class SumoEnv(gymnasium.Env):
-  def __init__(self, use_gui=False, use_random=False, use_actions=True):
+  def __init__(self, use_gui=False, use_random=False, use_actions=True, spawn_rate=0.3, use_libsumo=True, label=None, use_snapshot=False, warmup_steps=0, use_instrumentation=False, use_sumo_demand=False, demand_seed=None, emission_pollutants=("CO2",), use_decision_points=False, min_green=10, decision_interval=30, queue_threshold=3, use_idle_fast_forward=False, step_length=1.0, use_mesosim=False, crop_radius=None, use_network_cache=True):
     super().__init__() # Initializes the parent class
 
-    # Check if TraCI is already loaded; if so, close it
-    if traci.isLoaded():
-      traci.close()
+    # Pick the simulation backend: libsumo runs SUMO in-process (headless only), traci talks to it over a socket
+    self.backend = load_backend(use_gui=use_gui, use_libsumo=use_libsumo)
+
+    # Each env owns its own connection (self.sumo is set once the simulation is started)
+    self.label = label if label else new_label()
+    self.sumo = None
 
     # Define the Discrete action space with gymnasium.spaces.Discrete(n)
     # choices are up & down = green, or l & r = green
     self.action_space = gymnasium.spaces.Discrete(4)
+    # Action -> traffic light transitions (see perform_action for the phases), derived from the light's program once the network is loaded
+    self.action_phases = [0, 2, 5, 2] # green phase of each action (the left turn phase serves both left turn actions)
+    self.phase_transitions = None
+    self.transition_table = None
+
+    # Queen's Park intersection (College St. & University Ave.) - the only traffic light the agent controls
+    self.traffic_light_id = "cluster_21436517_21436518_391169149"
+
+    # Define lanes directly connected to the intersection, type = [left, straight, right]
+    # (the reward only looks at these lanes instead of every lane in the Queen's Park OSM export)
+    self.lanes = {
+      # Edge 1 (West incoming)
+      "1183480610#0_0": {"type": [0, 1, 1], "phases": [5]},  # Straight lane / right turn
+      "1183480610#0_1": {"type": [1, 1, 0], "phases": [5]},  # Straight lane / left turn
+
+      # Edge 2 (South incoming)
+      "33002810#0_2": {"type": [1, 1, 0], "phases": [0, 2]},  # Straight lane / left turn
+      "33002810#0_1": {"type": [0, 1, 0], "phases": [0]},  # Straight lane
+      "33002810#0_0": {"type": [0, 1, 1], "phases": [0]},  # Straight lane / right turn
+
+      # Edge 3 (East incoming)
+      "-33002812#2_0": {"type": [0, 1, 1], "phases": [5]},  # Straight lane / right turn
+      "-33002812#2_1": {"type": [1, 1, 0], "phases": [5]},  # Straight lane / left turn
+
+      # Edge 4 (North incoming)
+      "33002813#0_3": {"type": [1, 0, 0], "phases": [0, 2]},  # Left-turn lane
+      "33002813#0_2": {"type": [0, 1, 0], "phases": [0]},  # Straight lane
+      "33002813#0_1": {"type": [0, 1, 0], "phases": [0]},  # Straight lane
+      "33002813#0_0": {"type": [0, 1, 1], "phases": [0]}  # Right-turn lane
+    }
 
     # Define the Box observation space with gymnasium.spaces.Box()
     # Note the structure of the Box parameters requires NumPy arrays!
@@ -25,7 +77,15 @@ class SumoEnv(gymnasium.Env):
     max_cars = 20 # CHANGE FOR ACTUAL MAX. NUMBER OF CARS
     self.max_cars = max_cars
     
-    self.car_spawn_rate = 0.3 # cars spawn at 30% chance
+    self.car_spawn_rate = spawn_rate # probability that a random car spawns on each simulation step
+
+    # Routes random cars can take; start_edge: end_edge(s)
+    self.edge_mapping = {
+        "1183480610#0": ["444741638#0", "33002812#0", "22891215#0"], # West starting (College St.) -> [right, straight, left]
+        "33002810#0": ["33002812#0", "22891215#0", "-1183480610#4"], # South starting (University Ave.) -> [right, straight, left]
+        "-33002812#2": ["22891215#0", "-1183480610#4", "444741638#0"], # East starting (College St.) -> [right, straight, left]
+        "33002813#0": ["-1183480610#4", "444741638#0", "33002812#0"] # North starting (Queen's Park) -> [right, straight, left]
+    }
 
     # np array structure: [traffic_light_phase][positions][speeds], dtype=np.float32
     self.observation_space = gymnasium.spaces.Box(
@@ -61,60 +121,225 @@ class SumoEnv(gymnasium.Env):
     self.sumo_binary = sumo_binary
     self.sumo_config = sumo_config
 
+    # crop_radius: run on the network cropped to crop_radius metres around the intersection (keeping every random car's route)
+    # instead of the whole OSM export; built once and cached, polygons only kept for sumo-gui, see crop_network
+    if crop_radius is not None:
+      self.sumo_config = crop_network(sumo_config, self.lanes, self.edge_mapping, crop_radius, keep_polygons=use_gui)
+
+    # use_network_cache: start and reset from the network artifact cache - gzipped inputs decompressed and validated once,
+    # GUI settings and polygons left out of headless runs (see prepared_config)
+    if use_network_cache:
+      self.sumo_config = prepared_config(self.sumo_config, headless=not use_gui)
+
+    # step_length: simulated seconds per simulationStep (every action, yellow and hold time is in seconds whatever the step length)
+    # use_mesosim: SUMO's mesoscopic model (queues per edge segment instead of car following) - much cheaper, e.g. for pretraining
+    # before fine-tuning on the microscopic model; lane values such as halting numbers and waiting times are coarser there
+    self.step_length = step_length
+    self.use_mesosim = use_mesosim
+
+    # SUMO-native random cars: each episode's cars go into a seeded route file that SUMO inserts itself,
+    # instead of spawn_random_car adding them through TraCI on every step (same spawn rate, routes, speeds and max_cars cap)
+    self.demand = RandomDemand(self.edge_mapping, self.car_spawn_rate, self.max_cars, self.sumo_config, self.label) if use_random and use_sumo_demand else None
+
+    # demand_seed: episode n replays the cached demand schedule for seed demand_seed + n instead of rolling random cars live,
+    # so e.g. an RL env and a fixed-time env with the same demand_seed see exactly the same cars
+    self.demand_seed = demand_seed
+    self.schedule = None
+    self.spawn_opportunity = 0
+
+    # Subscriptions on the controlled lanes (and the vehicles on them) feed the reward
+    # Per-vehicle records (greatest wait time, emissions) of the vehicles on the controlled lanes, fed by the observer
+    # emission_pollutants: what is integrated per vehicle and per controlled lane for info["lane_emission_totals"] (any of CO2, NOx, fuel)
+    self.bookkeeper = VehicleBookkeeper(EmissionAccounting(emission_pollutants))
+    self.observer = SubscriptionObserver(self.lanes.keys(), vehicle_variables=VEHICLE_VARIABLES + [tc.VAR_DEPARTURE], bookkeeper=self.bookkeeper)
+
+    # Snapshot reset: restore a saved start-of-episode state instead of re-loading the network on every reset
+    self.use_snapshot = use_snapshot
+    if use_snapshot and self.demand: # a restored state holds the first episode's route file, so every episode would get the same cars
+      raise ValueError("use_snapshot cannot be combined with use_sumo_demand")
+    self.snapshot = SnapshotReset(self.label, warmup_steps=warmup_steps)
+    self.episode_count = 0 # 0-based index of the current episode: picks its demand seed and keeps route IDs unique between episodes (routes added earlier can outlive a state restore)
+
+    # Static network facts (TLS IDs, lane speeds/lengths, spawn edges), queried once per network and shared by every env in this process
+    self.network = None
+
+    # Optional TraCI call counts/latencies (per method, per step and per env phase), returned in info at episode end
+    self.instrumentation = Instrumentation() if use_instrumentation else None
+
     # Start the simulation
     self.started = False
 
-    # Track cumulative metrics
-    self.vehicle_wait_log = {}
-    self.total_congestion_log = []
-    self.total_speed_log = []
+    # Track cumulative metrics (constant memory: running means; per-vehicle records are in self.bookkeeper)
+    self.congestion_stats = RunningStats() # stopped vehicles per step
+    self.speed_stats = RunningStats() # average vehicle speed per step
 
     # use actions argument: False = use the timer based system instead (for comparing between agent and real-life)
     self.use_actions = use_actions
 
+    # use_decision_points: only ask the agent for an action at decision points (minimum green elapsed, queue change beyond
+    # queue_threshold, every decision_interval seconds) and fast-forward the simulation in between, see DecisionPoints
+    self.decision_points = DecisionPoints(min_green, decision_interval, queue_threshold) if use_decision_points else None
+
+    # use_idle_fast_forward: while the network is empty, jump to the step before the next departure in one simulationStep() call
+    # (needs the next random car in advance: use_sumo_demand or demand_seed), see fast_forward_idle
+    self.idle_fast_forward = IdleFastForward(self.sumo_config) if use_idle_fast_forward else None
+
     # Define consistent pause time for sumo-gui visualization
     self.pause_time = 0.1
 
+  def start_simulation(self):
+    # Launch SUMO on this env's own labelled connection (free port picked automatically, so many envs can run side by side)
+    self.sumo = connect(self.backend, [self.sumo_binary, "--start"] + self.simulation_args(), label=self.label)
+    if self.instrumentation:
+      self.sumo = InstrumentedConnection(self.sumo, self.instrumentation)
+    self.started = True
+    self.network = get_network_metadata(self.sumo, self.sumo_config, self.lanes, self.edge_mapping.keys())
+    traffic_light_id = self.traffic_light_id
+    if not self.transition_table: # this light's transitions, with the phase durations of its program
+      self.transition_table = PhaseTransitionTable(self.action_phases, self.network.traffic_light_program(self.sumo, traffic_light_id), self.phase_transitions, self.step_length)
+    self.sumo.trafficlight.setPhase(traffic_light_id, 0)
+    if self.use_actions:
+      self.sumo.trafficlight.setPhaseDuration(traffic_light_id, 99999)  # Hold this phase indefinitely
+
+    # Save the start-of-episode state once so later resets can restore it
+    if self.use_snapshot:
+      self.snapshot.save(self.sumo)
+
+    self.load_episode_schedule()
+
+    # Register the reward subscriptions for this episode
+    self.observer.subscribe(self.sumo, traffic_light_id)
+
+  def simulation_args(self):
+    # SUMO options for a new episode (with use_sumo_demand, plus the route file with this episode's random cars)
+    args = ["-c", self.sumo_config, "--step-length", str(self.step_length)]
+    if self.use_mesosim: # junction control keeps the traffic light in charge of the flow
+      args += ["--mesosim", "true", "--meso-junction-control", "true"]
+    if self.demand:
+      args += self.demand.write(self.episode_seed())
+    return args
+
+  def episode_seed(self):
+    # seed of this episode's random cars
+    if self.demand_seed is not None:
+      return self.demand_seed + self.episode_count
+    return int(self.np_random.integers(2**31 - 1))
+
+  def load_episode_schedule(self):
+    # with demand_seed (and per-step spawning), pick this episode's cached schedule and rewind it
+    if self.use_random and not self.demand and self.demand_seed is not None:
+      self.schedule = load_schedule(self.edge_mapping, self.car_spawn_rate, self.max_cars, self.episode_seed())
+      self.spawn_opportunity = 0
+
+  def spawn_cars(self):
+    # one spawn opportunity: replay the cached schedule if there is one, otherwise roll against the spawn rate
+    if self.schedule is not None:
+      spawn = self.deployed_counter < self.max_cars and self.schedule["depart"][self.deployed_counter] == self.spawn_opportunity
+      self.spawn_opportunity += 1
+    else:
+      spawn = (random.random() < self.car_spawn_rate) and (self.deployed_counter < self.max_cars)
+
+    if spawn:
+      self.spawn_random_car(self.deployed_counter)
+      self.deployed_counter += 1
+
+  def fast_forward_idle(self):
+    # runs the steps up to the next departure in one call while nothing is on the network; returns the number of steps skipped
+    if any(self.observer.vehicle_count(lane_id) for lane_id in self.observer.lane_ids):
+      return 0
+    current_time = self.observer.time()
+    step_length = self.observer.step_length()
+    if not self.use_random:
+      spawn_steps = math.inf
+    elif self.demand:
+      spawn_steps = self.demand.idle_steps(current_time, step_length)
+    elif self.schedule is not None:
+      spawn_steps = int(self.schedule["depart"][self.deployed_counter]) - self.spawn_opportunity if self.deployed_counter < self.max_cars else math.inf
+    else: # live random spawning: the next car is not known in advance
+      return 0
+
+    steps = self.idle_fast_forward.steps(self.sumo, current_time, step_length, spawn_steps)
+    if not steps:
+      return 0
+    self.sumo.simulationStep(current_time + steps * step_length)
+    if self.schedule is not None: # every skipped step was a spawn opportunity without a car
+      self.spawn_opportunity += steps
+
+    # the skipped steps repeat the empty state: every vehicle metric (and so the reward) is 0
+    self.congestion_stats.add(0, count=steps)
+    self.speed_stats.add(0, count=steps)
+    return steps
+
+  def timed(self, phase):
+    # attributes the TraCI calls made inside the block to an env phase (no-op unless use_instrumentation)
+    return self.instrumentation.phase(phase) if self.instrumentation else contextlib.nullcontext()
+
   def step(self, action):
     # On first step, start the traci sim
     if not self.started:
-      traci.start([self.sumo_binary, "--start", "-c", self.sumo_config])
-      self.started = True
-      traffic_light_id = traci.trafficlight.getIDList()[0]
-      traci.trafficlight.setPhase(traffic_light_id, 0)
-      if self.use_actions:
-        traci.trafficlight.setPhaseDuration(traffic_light_id, 99999)  # Hold this phase indefinitely
+      self.start_simulation()
     
+    if self.instrumentation:
+      self.instrumentation.new_step()
+
     # Perform the action
     if self.use_actions:
-      self.perform_action(action)
+      with self.timed("perform_action"):
+        self.perform_action(action)
     
-    # Spawn in a car if suits the spawn rate on step
-    if self.use_random:
-      if (random.random() < self.car_spawn_rate) and (self.deployed_counter < self.max_cars):
-        self.spawn_random_car(self.deployed_counter)
-        self.deployed_counter += 1
+    # Advance to the agent's next decision: a single simulation step, or with use_decision_points every step up to the
+    # next decision point (the reward is accumulated over them)
+    reward = 0
+    decision_steps = 0
+    skipped_time = 0
+    while True:
+      # Nothing on the network: jump over the steps before the next departure in one call
+      if self.idle_fast_forward:
+        with self.timed("idle_fast_forward"):
+          skipped_steps = self.fast_forward_idle()
+        decision_steps += skipped_steps
+        skipped_time += skipped_steps * self.observer.step_length()
+
+      # Spawn in a car if suits the spawn rate on step (SUMO inserts them itself with use_sumo_demand)
+      if self.use_random and not self.demand:
+        with self.timed("spawn_random_car"):
+          self.spawn_cars()
   
 
-    # Advance the simulation by one step
-    traci.simulationStep()
-    if self.use_gui: # pause in between steps to slow down if in 'simulation mode'
-      time.sleep(self.pause_time) 
-    print("Step: " + str(traci.simulation.getTime()))
-    # Get the new state
-    observation = self.get_state()
-
-    # Calculate the reward
-    reward = self.calculate_reward()
-
-    # Determine if simulation is done
-    done = self.is_done()
+      # Advance the simulation by one step
+      with self.timed("simulation_step"):
+        self.sumo.simulationStep()
+      if self.use_gui: # pause in between steps to slow down if in 'simulation mode'
+        time.sleep(self.pause_time) 
+      with self.timed("simulation_step"):
+        self.observer.update(self.sumo)
+      #print("Step: " + str(self.sumo.simulation.getTime()))
+      # Get the new state
+      with self.timed("get_state"):
+        observation = self.get_state()
+
+      # Calculate the reward
+      with self.timed("calculate_reward"):
+        reward += self.calculate_reward()
+
+      # Determine if simulation is done
+      if self.demand: # count the route-file cars whose departure time has passed
+        self.deployed_counter = self.demand.deployed_count(self.observer.time())
+      with self.timed("is_done"):
+        done = self.is_done()
+      decision_steps += 1
+      if done or not self.decision_points or self.decision_points.is_decision_point(self.observer.time(), self.observer.phase(), self.calculate_total_stops(self.lanes.keys())):
+        break
 
     # Set placeholder for info -> returns the tracked cumulative metrics IF done
     info = {
-      "vehicle_wait_log": self.vehicle_wait_log if done else None,
-      "total_congestion_avg": (sum(self.total_congestion_log) / len(self.total_congestion_log)) if done and self.total_congestion_log else None,
-      "total_speed_avg": (sum(self.total_speed_log) / len(self.total_speed_log)) if done and self.total_speed_log else None
+      "wait_time_stats": self.bookkeeper.wait_time_stats.summary() if done else None, # count/mean/std/min/max/percentiles over vehicles
+      "total_congestion_avg": self.congestion_stats.mean if done and self.congestion_stats.count else None,
+      "total_speed_avg": self.speed_stats.mean if done and self.speed_stats.count else None,
+      "lane_emission_totals": self.bookkeeper.emissions.summary() if done else None, # mg per episode on the controlled lanes: total, per vehicle, per lane
+      "traci_stats": self.instrumentation.summary() if done and self.instrumentation else None,
+      "decision_steps": decision_steps, # simulation steps since the last decision (after the action's own transition)
+      "skipped_time": skipped_time # simulated seconds of those that were fast-forwarded over an empty network
     }
 
     # Set placeholder for truncated
@@ -132,41 +357,67 @@ class SumoEnv(gymnasium.Env):
     # this depends on if the command -> traci.simulationStep() exists somewhere else in the Class
     pass
 
+  def close(self):
+    # shut down the simulation (whichever backend is running it)
+    if self.started:
+      self.sumo.close()
+      self.started = False
+    self.snapshot.cleanup()
+    if self.demand:
+      self.demand.cleanup()
+
   def reset(self, seed=None, options=None):
 
     # resets the gymnasium.Env parent class
     super().reset(seed=seed)
+    if self.instrumentation: # stats in info cover one episode (including this reset)
+      self.instrumentation.reset()
+    if self.started: # the first episode is 0 whether reset() or step() starts the simulation
+      self.episode_count += 1
 
     # close the simulation (reset)
-    if not self.use_gui: # traci.load() doesn't work for sumo-gui - i.e. can only run once
-      traci.load(["-c", self.sumo_config])
+    if not self.started: # vectorized envs call reset() before the first step
+      self.start_simulation()
+    elif self.use_snapshot: # restoring the saved state skips re-parsing the network (and also works in sumo-gui)
+      self.snapshot.restore(self.sumo)
+      self.observer.subscribe(self.sumo, self.traffic_light_id)
+    elif not self.use_gui: # traci.load() doesn't work for sumo-gui - i.e. can only run once
+      self.sumo.load(self.simulation_args())
+      self.observer.subscribe(self.sumo, self.traffic_light_id) # loading drops every subscription
 
     # reset counter variables
     if self.use_random:
       self.deployed_counter = 0
     else:
       self.deployed_counter = 1
+    self.load_episode_schedule()
+
+    # the episode statistics in info cover one episode (the bookkeeper is reset when the observer subscribes)
+    self.congestion_stats.reset()
+    self.speed_stats.reset()
 
     # convert 'observation' to a NumPy array
     observation = np.array(self.get_state(), dtype=np.float32)
 
+    if self.decision_points: # the episode starts at a decision point
+      self.decision_points.reset(self.observer.time(), self.observer.phase(), self.calculate_total_stops(self.lanes.keys()))
+
     # return 'observation' and 'info' --> MUST be in this form
     return observation, {}
 
   def get_state(self):
     # Get the traffic light phase
-    traffic_light_ids = traci.trafficlight.getIDList()
-    traffic_light_phase = traci.trafficlight.getPhase(traffic_light_ids[0]) # only 1 in this network
+    traffic_light_phase = self.sumo.trafficlight.getPhase(self.traffic_light_id)
 
     # Get vehicle IDs and limit to max_cars
-    vehicle_ids = traci.vehicle.getIDList()
+    vehicle_ids = self.sumo.vehicle.getIDList()
 
     # Collect positions and speeds, padding if fewer than max_cars
     positions = []
     speeds = []
     for v_id in vehicle_ids:
-      position = traci.vehicle.getPosition(v_id)  # Returns (x, y) tuple
-      speed = traci.vehicle.getSpeed(v_id)
+      position = self.sumo.vehicle.getPosition(v_id)  # Returns (x, y) tuple
+      speed = self.sumo.vehicle.getSpeed(v_id)
       positions.extend(position)  # Add x, y to positions list
       speeds.append(speed)
 
@@ -181,81 +432,51 @@ class SumoEnv(gymnasium.Env):
     return obs
 
   def perform_action(self, action):
-
-    light_id = traci.trafficlight.getIDList()[0]
-    current_phase = traci.trafficlight.getPhase(light_id)
-
     """
-    Phases: 
-      (0) E & W = green, N & S = red
-      (1) E & W = yellow, N & S = red
-      (2) all red
-      (3) E & W = red, N & S turn/U-turn, green
-      (4) E & W = red, N & S turn/U-turn, yellow
-      (5) all red
-      (6) E & W = red, N & S = green 
-      (7) E & W = red, N & S left turn/U-turn = green, straight = yellow 
-      (8) E & W = red, N & S left turn/U-turn = green (only good one)
-      (9) E & W = red, N & S left turn/U-turn = yellow
-      (10) all red 
-      (11) - (13) duplicates -> note to self, lines going E&W are for the streetcart, so not bugged!
-      
-      Define action 0 as switching green to E & W; thus turning N & S left turns yellow (9), then red (10), then E&W green (0)
-      Define action 1 as switching green to N left turn/U-turn for streetcars; thus make E&W yellow (1) then red (2) then make N left turns green (3)
-      Define action 2 as switching green to N&S both; thus make turn yellow (4) then red (5) then make N&S green (6)
-      Define action 3 as switching green to S left turn; thus make straights yellow (7), then make straights red (8)
+    Phases (the light's program in osm.net.xml.gz):
+      (0) N & S = green, E & W = red
+      (1) N & S = yellow, left turns/U-turns still green
+      (2) left turns/U-turns only = green
+      (3) left turns/U-turns = yellow
+      (4) all red
+      (5) N & S = red, E & W = green
+      (6) E & W = yellow
+      (7) all red
+
+      Define action 0 as switching green to N & S
+      Define action 1 as switching green to the left turns/U-turns for streetcars
+      Define action 2 as switching green to E&W both
+      Define action 3 as switching green to the left turns (the S left turn has no phase of its own)
+
+      The yellow / all red phases in between come from the program (see trafficlightrl.phases.program_transitions)
     """
-
-    if action == 0 and current_phase != 0:
-      traci.trafficlight.setPhase(light_id, 9)  # transition to yellow
-      traci.trafficlight.setPhaseDuration(light_id, 4)  # set yellow duration
-      self.skip_steps(3)
-      traci.trafficlight.setPhase(light_id, 10)  # all red
-      traci.trafficlight.setPhaseDuration(light_id, 1)  # set red duration
-      self.skip_steps(3)
-      traci.trafficlight.setPhase(light_id, 0)  # set E-W green
-      traci.trafficlight.setPhaseDuration(light_id, 99999)  # Hold this phase indefinitely
-      self.skip_steps(5) # ensure light is green for at least 3 seconds
-
-    elif action == 1 and current_phase != 3:
-      traci.trafficlight.setPhase(light_id, 1)  # transition to yellow
-      traci.trafficlight.setPhaseDuration(light_id, 4)  # set yellow duration
-      self.skip_steps(3)
-      traci.trafficlight.setPhase(light_id, 2)  # all red
-      traci.trafficlight.setPhaseDuration(light_id, 1)  # set red duration
-      self.skip_steps(3)
-      traci.trafficlight.setPhase(light_id, 3)  # let streetcars pass
-      traci.trafficlight.setPhaseDuration(light_id, 99999)  # Hold this phase indefinitely
-      self.skip_steps(5) # ensure light is green for at least 3 seconds
-
-    elif action == 2 and current_phase != 6:
-      traci.trafficlight.setPhase(light_id, 4)  # transition to yellow
-      traci.trafficlight.setPhaseDuration(light_id, 4)  # set yellow duration
-      self.skip_steps(3)
-      traci.trafficlight.setPhase(light_id, 5)  # all red
-      traci.trafficlight.setPhaseDuration(light_id, 1)  # set red duration
-      self.skip_steps(3)
-      traci.trafficlight.setPhase(light_id, 6)  # set N-S green
-      traci.trafficlight.setPhaseDuration(light_id, 99999)  # Hold this phase indefinitely
-      self.skip_steps(5) # ensure light is green for at least 3 seconds
-
-    elif action == 3 and current_phase != 8:
-      traci.trafficlight.setPhase(light_id, 7)  # transition to yellow
-      traci.trafficlight.setPhaseDuration(light_id, 4)  # set yellow duration
-      self.skip_steps(3)
-      traci.trafficlight.setPhase(light_id, 8)  # straights red, left turns green
-      traci.trafficlight.setPhaseDuration(light_id, 99999)  # set red duration
-      self.skip_steps(5)
+    # the phase changes for (current phase, action) were compiled in start_simulation;
+    # the current phase comes from the traffic light subscription
+    self.transition_table.execute(self.sumo, self.traffic_light_id, self.observer.phase(), action, self.skip_steps)
 
   def calculate_reward(self):
     # REWARD FUNCTION: Calculate the reward (should be negative if in a poor state i.e. high congestion)
-    lane_ids = traci.lane.getIDList()
-    vehicle_ids = traci.vehicle.getIDList()
+    # Only vehicles on the controlled lanes (self.lanes) count; the terms are NumPy operations over the subscribed vehicle data
     try:
-      congestion = self.calculate_congestion(vehicle_ids)
-      wait_time = self.calculate_avg_wait_time(lane_ids)
-      stops = self.calculate_total_stops(lane_ids)
-      avg_speed = self.calculate_avg_speed(vehicle_ids)# -> would be maximize so don't multiply by -1
+      vehicle_ids = self.observer.vehicle_ids()
+      speeds = self.observer.vehicle_values(vehicle_ids, tc.VAR_SPEED)
+      wait_times = self.observer.vehicle_values(vehicle_ids, tc.VAR_WAITING_TIME)
+      departures = self.observer.vehicle_values(vehicle_ids, tc.VAR_DEPARTURE)
+
+      # congestion: stopped vehicles that are not just starting/departing (within 1s of their departure)
+      current_time = self.observer.time()
+      just_departed = (current_time % 1 == 0) & (np.abs(current_time - departures.astype(int)) <= 1)
+      congestion = int(np.count_nonzero((speeds == 0) & ~just_departed))
+      self.congestion_stats.add(congestion)
+
+      # average wait time (the greatest wait time of each vehicle is kept by self.bookkeeper)
+      wait_time = wait_times.mean() if vehicle_ids else 0
+
+      stops = self.calculate_total_stops(self.lanes)
+
+      avg_speed = speeds.mean() if vehicle_ids else 0 # -> would be maximize so don't multiply by -1
+      self.speed_stats.add(avg_speed)
+
       reward = -1*(1.5*congestion + 1.5*wait_time + stops) + 0.75*avg_speed # minimize all terms
     except:
       reward = 0
@@ -264,128 +485,59 @@ class SumoEnv(gymnasium.Env):
 
   def skip_steps(self, x):
     for _ in range(x): 
-      traci.simulationStep()
+      self.sumo.simulationStep()
+      self.observer.update(self.sumo) # vehicles departing in this step are only reported now
       if self.use_gui:
         time.sleep(self.pause_time)
 
   def is_done(self):
     max_time = 1000  # Example maximum simulation time
-    return (traci.simulation.getTime() >= max_time or len(traci.vehicle.getIDList()) == 0) and self.deployed_counter != 0
+    return (self.sumo.simulation.getTime() >= max_time or len(self.sumo.vehicle.getIDList()) == 0) and self.deployed_counter != 0
 
 
   # METRICS:
-  def calculate_congestion(self, vehicle_ids):
-    congestion = 0
-    current_time = traci.simulation.getTime()  # Get the current simulation time
-    
-    for vehicle_id in vehicle_ids:
-      departure_time = traci.vehicle.getDeparture(vehicle_id)  # Get each vehicle's departure time
-      speed = traci.vehicle.getSpeed(vehicle_id)  # Get the vehicle's current speed
-      
-      # Check if the vehicle is stopped and not just starting/departing
-      if speed == 0 and current_time not in range(int(departure_time) - 1, int(departure_time) + 2):
-          congestion += 1  # Increment congestion counter for stopped vehicles
-  
-    # update congestion log
-    self.total_congestion_log.append(congestion)
-
-    return congestion
-
-
-  def calculate_avg_wait_time(self, lane_ids):
-    wait_times = []
-    
-    # total wait time of cars in all lanes
-    for lane_id in lane_ids:
-      # total wait time of all cars in one lane
-      for vehicle_id in traci.lane.getLastStepVehicleIDs(lane_id):
-          wait_time = traci.vehicle.getWaitingTime(vehicle_id)
-
-          # update the wait log
-          if vehicle_id in self.vehicle_wait_log:
-            self.vehicle_wait_log[vehicle_id] = max(self.vehicle_wait_log[vehicle_id], wait_time) # only want the greatest average wait time for each vehicle
-          else:
-            self.vehicle_wait_log[vehicle_id] = wait_time
-
-          wait_times.append(wait_time)
-  
-    avg_wait_time = sum(wait_times)/len(wait_times) if wait_times else 0
-    
-    return avg_wait_time
-
   def calculate_total_stops(self, lane_ids):
-    total_stops = 0
-    for lane_id in lane_ids:
-      stops_in_lane = traci.lane.getLastStepHaltingNumber(lane_id)
-      total_stops += stops_in_lane
+    # halting vehicles per lane come from the observer's lane subscription (no TraCI call per lane)
+    total_stops = sum(self.observer.halting_number(lane_id) for lane_id in lane_ids)
 
     return total_stops
     
-  def calculate_avg_speed(self, vehicle_ids):
-    total_speed = sum(traci.vehicle.getSpeed(v_id) for v_id in vehicle_ids)
-    avg_speed = total_speed / len(vehicle_ids) if vehicle_ids else 0
-
-    # update total speed log
-    self.total_speed_log.append(avg_speed)
-
-    return avg_speed
-
   def spawn_random_car(self, step_counter):
     """
     Spawns a random car with a unique ID and assigns it a random route.
-    edge_mapping represents the available routes that any car can take; start_edge:end_edge
+    self.edge_mapping represents the available routes that any car can take; start_edge:end_edge
     """
-    edge_mapping = {
-    #north traffic light
-    #'466414089#0':'466414089#1', 
-    '466414089#1':'35519718#1',
-    '466414089#1':'182704478#1',
-    '466414089#1':'184789522#1',
-    
-    #west traffic light
-    #'42684286':'466414379#0', 
-    '466414379#0':'35519718#1',
-    '466414379#0':'182704478#1',
-    '466414379#0':'184789522#1',
-    '466414379#0':'50876968#1',
-    
-    #south traffic light
-    '25634438#0':'35519718#1',
-    '25634438#0':'50876968#1',
-    '25634438#0':'184789522#1',
-
-    #east traffic light
-    '466414380#0':'50876968#1',
-    '466414380#0':'35519718#1',
-    '466414380#0':'182704478#1'
-    }
     
     vehicle_id = f"rand_car_{step_counter}"
 
-    edges = traci.edge.getIDList()
-    start_edges = []
-    for edge in edges:
-        if not edge.startswith('-') and not edge.startswith(':') and edge in edge_mapping:
-            start_edges.append(edge)
-    
-    start_edge = random.choice(start_edges)
-    end_edge = edge_mapping[start_edge]
+    if not self.network.spawn_edges: # none of the start edges exist in this network
+      return
+
+    if self.schedule is not None: # replay the cached demand schedule
+      _, start, end, speed = self.schedule[step_counter].tolist()
+      start_edge = list(self.edge_mapping)[start]
+      end_edge = self.edge_mapping[start_edge][end]
+    else:
+      start_edge = random.choice(self.network.spawn_edges)
+      end_edge = random.choice(self.edge_mapping[start_edge])
+      speed = random.uniform(5, 15)
 
-    route_id = f"route_{vehicle_id}"
+    route_id = f"route_{self.episode_count}_{vehicle_id}"
 
     try:
-        traci.route.add(routeID=route_id, edges=[start_edge, end_edge])
+        self.sumo.route.add(routeID=route_id, edges=[start_edge, end_edge])
 
         # Add the vehicle to the simulation
-        traci.vehicle.add(vehID=vehicle_id, routeID=route_id)
+        self.sumo.vehicle.add(vehID=vehicle_id, routeID=route_id)
 
-        print(f"Deployed random vehicle {vehicle_id} from {start_edge} to {end_edge}")
+        #print(f"Deployed random vehicle {vehicle_id} from {start_edge} to {end_edge}")
 
         # Set a random speed for the vehicle
-        traci.vehicle.setSpeed(vehicle_id, random.uniform(5, 15))
+        self.sumo.vehicle.setSpeed(vehicle_id, speed)
 
-    except traci.TraCIException as e:
-        print(f"Failed to add vehicle {vehicle_id} on route from {start_edge} to {end_edge}: {e}")
+    except self.backend.TraCIException as e:
+        pass
+        #print(f"Failed to add vehicle {vehicle_id} on route from {start_edge} to {end_edge}: {e}")
         
 
 
@@ -408,6 +560,6 @@ if __name__ == "__main__":
 
       score_log.append(score)
 
-  traci.close()
+  env.close()
   mean_sample_score = np.mean(score_log)*episodes
   print(f"Mean Score over {episodes} episodes: {mean_sample_score}")
@@ -0,0 +1,35 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from trafficlightrl.demand import sample_schedule, steps_before
+
+EDGE_MAPPING = {"a": ["b", "c"], "d": ["e"], "f": ["g", "h", "i"]}
+
+
+def test_schedule_is_deterministic_per_seed():
+  first = sample_schedule(EDGE_MAPPING, 0.3, 200, seed=7)
+  assert np.array_equal(first, sample_schedule(EDGE_MAPPING, 0.3, 200, seed=7))
+  assert not np.array_equal(first, sample_schedule(EDGE_MAPPING, 0.3, 200, seed=8))
+
+
+def test_schedule_draws_valid_cars():
+  schedule = sample_schedule(EDGE_MAPPING, 0.3, 500, seed=0, speed_range=(5, 15))
+  num_end_edges = np.array([len(end_edges) for end_edges in EDGE_MAPPING.values()])
+
+  assert len(schedule) == 500
+  assert schedule["depart"][0] >= 0 and np.all(np.diff(schedule["depart"]) >= 1) # at most one car per second
+  assert np.all((schedule["start"] >= 0) & (schedule["start"] < len(EDGE_MAPPING)))
+  assert np.all(schedule["end"] < num_end_edges[schedule["start"]])
+  assert np.all((schedule["speed"] >= 5) & (schedule["speed"] < 15))
+  # geometric gaps: about one car every 1 / spawn_rate seconds
+  assert schedule["depart"][-1] / len(schedule) == pytest.approx(1 / 0.3, rel=0.15)
+
+
+def test_steps_before_next_departure():
+  departures = np.array([3.0, 3.0, 10.0])
+  assert steps_before(departures, 0, 1.0) == 3
+  assert steps_before(departures, 4, 1.0) == 6
+  assert steps_before(departures, 4, 2.0) == 3
+  assert steps_before(departures, 10, 1.0) == 0
+  assert steps_before(departures, 11, 1.0) == float("inf")
@@ -0,0 +1,52 @@
+import os
+import shutil
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("traci")
+pytest.importorskip("gymnasium")
+
+from trafficlightrl import baseline
+from trafficlightrl.benchmark import load_env_class
+from trafficlightrl.demand import load_schedule
+
+pytestmark = pytest.mark.skipif(shutil.which("sumo") is None and "SUMO_HOME" not in os.environ, reason="needs SUMO")
+
+DEMAND_SEED = 7
+
+
+def fixed_time_seeds(env, episodes, monkeypatch):
+  # the seed evaluate_fixed_time hands to each fixed-time episode
+  seeds = []
+  monkeypatch.setattr(baseline, "run_fixed_time", lambda *args, **kwargs: seeds.append(args[4]))
+  baseline.evaluate_fixed_time(env, episodes, demand_seed=DEMAND_SEED)
+  return seeds
+
+
+def schedule(env, seed):
+  return load_schedule(env.edge_mapping, env.car_spawn_rate, env.max_cars, seed)
+
+
+@pytest.fixture
+def env():
+  env = load_env_class("McMaster")(use_random=True, use_libsumo=False, demand_seed=DEMAND_SEED)
+  yield env
+  env.close()
+
+
+def test_reset_first_env_replays_fixed_time_demand(env, monkeypatch):
+  seeds = fixed_time_seeds(env, 2, monkeypatch)
+
+  env.reset()
+  assert np.array_equal(env.schedule, schedule(env, seeds[0]))
+  env.reset()
+  assert np.array_equal(env.schedule, schedule(env, seeds[1]))
+
+
+def test_step_first_env_replays_fixed_time_demand(env, monkeypatch):
+  seeds = fixed_time_seeds(env, 2, monkeypatch)
+
+  env.step(env.action_space.sample())
+  assert np.array_equal(env.schedule, schedule(env, seeds[0]))
+  env.reset()
+  assert np.array_equal(env.schedule, schedule(env, seeds[1]))
@@ -0,0 +1,40 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("traci")
+
+from trafficlightrl.observation import ObservationLayout
+
+LANES = {
+  "east_0": {"type": [0, 1, 0], "phases": [0]},
+  "east_1": {"type": [1, 0, 0], "phases": [0, 2]},
+  "north_0": {"type": [0, 0, 1], "phases": [2, 5, 7]},
+  "south_0": {"type": [0, 1, 0], "phases": [5]}
+}
+PHASES = [0, 2, 5, 7]
+
+
+def test_layout_size_and_lane_types():
+  layout = ObservationLayout(LANES, PHASES)
+
+  assert layout.size == 2 + len(LANES) * 8
+  assert layout.buffer.shape == (layout.size,) and layout.buffer.dtype == np.float32
+  assert layout.lane_ids == list(LANES)
+  assert np.array_equal(layout.lane_rows[:, 5:], [lane["type"] for lane in LANES.values()])
+  assert not layout.lane_rows[:, :5].any() and not layout.buffer[:2].any()
+
+
+def test_lane_rows_write_into_the_buffer():
+  layout = ObservationLayout(LANES, PHASES)
+  layout.lane_rows[2, 0] = 7 # vehicles on north_0
+
+  assert layout.buffer[2 + 2 * 8] == 7
+
+
+def test_time_since_visited_matches_per_lane_loop():
+  layout = ObservationLayout(LANES, PHASES)
+  last_phase_change_time = {0: 12.0, 2: 3.0, 5: 40.0, 7: 8.0}
+
+  # calculate_reward's per-lane loop: the smallest time of the lane's phases over the largest time of any phase
+  expected = [min(last_phase_change_time[phase] for phase in lane["phases"]) / max(last_phase_change_time.values()) for lane in LANES.values()]
+  assert layout.time_since_visited(last_phase_change_time) == pytest.approx(expected)
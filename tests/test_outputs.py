@@ -0,0 +1,86 @@
+from trafficlightrl.outputs import iter_records, parse_emissions, parse_summary, parse_tripinfo
+
+EMISSIONS = """<emission-export>
+  <timestep time="0.00">
+    <vehicle id="a" CO2="100" NOx="1" fuel="10" lane="in_0" speed="0.00" waiting="0.00"/>
+  </timestep>
+  <timestep time="1.00">
+    <vehicle id="a" CO2="200" NOx="2" fuel="20" lane="in_0" speed="0.00" waiting="1.00"/>
+    <vehicle id="b" CO2="50" NOx="1" fuel="5" lane="other_0" speed="4.00" waiting="0.00"/>
+  </timestep>
+  <timestep time="2.00">
+    <vehicle id="a" CO2="300" NOx="3" fuel="30" lane="in_0" speed="0.00" waiting="2.00"/>
+    <vehicle id="b" CO2="50" NOx="1" fuel="5" lane="other_0" speed="2.00" waiting="0.00"/>
+  </timestep>
+  <timestep time="3.00">
+    <vehicle id="b" CO2="50" NOx="1" fuel="5" lane="in_0" speed="0.00" waiting="1.00"/>
+  </timestep>
+</emission-export>
+"""
+
+TRIPINFO = """<tripinfos>
+  <tripinfo id="a" waitingTime="4.00">
+    <emissions CO2_abs="1000" NOx_abs="5" fuel_abs="300"/>
+  </tripinfo>
+  <tripinfo id="b" waitingTime="0.00">
+    <emissions CO2_abs="500" NOx_abs="2" fuel_abs="100"/>
+  </tripinfo>
+</tripinfos>
+"""
+
+SUMMARY = """<summary>
+  <step time="0.00" halting="0" meanSpeed="-1.00"/>
+  <step time="1.00" halting="2" meanSpeed="3.00"/>
+</summary>
+"""
+
+
+def write(tmp_path, name, content):
+  path = tmp_path / name
+  path.write_text(content)
+  return str(path)
+
+
+def test_iter_records_yields_complete_records(tmp_path):
+  path = write(tmp_path, "emission.xml", EMISSIONS)
+  records = [(timestep.get("time"), [vehicle.get("id") for vehicle in timestep.iter("vehicle")]) for timestep in iter_records(path, "timestep")]
+  assert records == [("0.00", ["a"]), ("1.00", ["a", "b"]), ("2.00", ["a", "b"]), ("3.00", ["b"])]
+
+
+def test_iter_records_reads_nested_tags(tmp_path):
+  path = write(tmp_path, "tripinfo.xml", TRIPINFO)
+  assert [emissions.get("CO2_abs") for emissions in iter_records(path, "emissions")] == ["1000", "500"]
+
+
+def test_iter_records_reads_gzip(tmp_path):
+  import gzip
+  path = tmp_path / "summary.xml.gz"
+  with gzip.open(path, "wt") as f:
+    f.write(SUMMARY)
+  assert [step.get("halting") for step in iter_records(str(path), "step")] == ["0", "2"]
+
+
+def test_parse_emissions(tmp_path):
+  metrics = parse_emissions(write(tmp_path, "emission.xml", EMISSIONS))
+
+  # a departs at 0 and is only congestion from t=2 on, b departs at 1 and is congestion at t=3
+  assert metrics["total_congestion_avg"] == 2 / 4
+  assert metrics["total_speed_avg"] == (0 + 2 + 1 + 0) / 4
+  assert metrics["wait_time_stats"].summary()["max"] == 2
+  assert metrics["emission_stats"]["CO2"].total() == 600 + 150
+
+
+def test_parse_emissions_on_lanes(tmp_path):
+  metrics = parse_emissions(write(tmp_path, "emission.xml", EMISSIONS), lane_ids=["in_0"])
+
+  # b only counts from when it is on in_0
+  assert metrics["emission_stats"]["CO2"].total() == 600 + 50
+  assert metrics["total_congestion_avg"] == 2 / 4 # network-wide either way
+
+
+def test_parse_tripinfo_and_summary(tmp_path):
+  wait_time_stats, emission_stats = parse_tripinfo(write(tmp_path, "tripinfo.xml", TRIPINFO))
+  assert wait_time_stats.summary()["mean"] == 2
+  assert emission_stats["CO2"].total() == 1500
+
+  assert parse_summary(write(tmp_path, "summary.xml", SUMMARY)) == (1, 1.5)
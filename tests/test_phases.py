@@ -0,0 +1,176 @@
+import os
+import shutil
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("traci")
+pytest.importorskip("gymnasium")
+
+from trafficlightrl.benchmark import load_env_class
+from trafficlightrl.phases import ANY, CURRENT, HOLD, PhaseTransitionTable
+
+# McMaster's 10 phases: greens 0, 2, 5, 7, yellows 1, 3, 6, 8, all-red 4 and 9 (see its perform_action)
+PROGRAM = [("", duration) for duration in (31, 3, 6, 3, 2, 31, 3, 6, 3, 2)]
+
+
+class FakeLight:
+  """A traffic light that only records which phase ran for how long with which duration"""
+
+  def __init__(self, phase):
+    self.trafficlight = self
+    self.phase = phase
+    self.duration = None
+    self.segments = []
+
+  def getPhase(self, traffic_light_id):
+    return self.phase
+
+  def setPhase(self, traffic_light_id, phase):
+    self.phase = phase
+    self.duration = PROGRAM[phase][1] # SUMO starts a phase with its programmed duration
+
+  def setPhaseDuration(self, traffic_light_id, duration):
+    self.duration = duration
+
+  def skip_steps(self, num_steps):
+    self.segments.append((self.phase, self.duration, num_steps))
+
+
+def if_elif_perform_action(conn, light_id, action, skip_steps):
+  # McMaster's perform_action before the transition table
+  current_phase = conn.trafficlight.getPhase(light_id)
+  if action == 0 and current_phase != 0:
+    if current_phase == 2:
+      conn.trafficlight.setPhase(light_id, 3)
+    elif current_phase == 7:
+      conn.trafficlight.setPhase(light_id, 8)
+    elif current_phase == 5:
+      conn.trafficlight.setPhase(light_id, 6)
+      conn.trafficlight.setPhaseDuration(light_id, 3)
+      skip_steps(3)
+      conn.trafficlight.setPhase(light_id, 8)
+    conn.trafficlight.setPhaseDuration(light_id, 3)
+    skip_steps(3)
+    conn.trafficlight.setPhase(light_id, 4)
+    conn.trafficlight.setPhaseDuration(light_id, 2)
+    skip_steps(2)
+    conn.trafficlight.setPhase(light_id, 0)
+    conn.trafficlight.setPhaseDuration(light_id, 99999)
+    skip_steps(5)
+
+  elif action == 1 and current_phase != 2:
+    if current_phase == 0:
+      conn.trafficlight.setPhase(light_id, 1)
+      conn.trafficlight.setPhaseDuration(light_id, 3)
+      skip_steps(3)
+      conn.trafficlight.setPhase(light_id, 3)
+    elif current_phase == 7:
+      conn.trafficlight.setPhase(light_id, 8)
+    elif current_phase == 5:
+      conn.trafficlight.setPhase(light_id, 6)
+      conn.trafficlight.setPhaseDuration(light_id, 3)
+      skip_steps(3)
+      conn.trafficlight.setPhase(light_id, 8)
+    conn.trafficlight.setPhaseDuration(light_id, 3)
+    skip_steps(3)
+    conn.trafficlight.setPhase(light_id, 4)
+    conn.trafficlight.setPhaseDuration(light_id, 2)
+    skip_steps(2)
+    conn.trafficlight.setPhase(light_id, 2)
+    conn.trafficlight.setPhaseDuration(light_id, 99999)
+    skip_steps(5)
+
+  elif action == 2 and current_phase != 7:
+    if current_phase == 2:
+      conn.trafficlight.setPhase(light_id, 3)
+    elif current_phase == 0:
+      conn.trafficlight.setPhase(light_id, 1)
+      conn.trafficlight.setPhaseDuration(light_id, 3)
+      skip_steps(3)
+      conn.trafficlight.setPhase(light_id, 3)
+    elif current_phase == 5:
+      conn.trafficlight.setPhase(light_id, 6)
+      conn.trafficlight.setPhaseDuration(light_id, 3)
+      skip_steps(3)
+      conn.trafficlight.setPhase(light_id, 8)
+    conn.trafficlight.setPhaseDuration(light_id, 3)
+    skip_steps(3)
+    conn.trafficlight.setPhase(light_id, 4)
+    conn.trafficlight.setPhaseDuration(light_id, 2)
+    skip_steps(2)
+    conn.trafficlight.setPhase(light_id, 7)
+    conn.trafficlight.setPhaseDuration(light_id, 99999)
+    skip_steps(5)
+
+  elif action == 3 and current_phase != 5:
+    if current_phase == 2:
+      conn.trafficlight.setPhase(light_id, 3)
+    elif current_phase == 7:
+      conn.trafficlight.setPhase(light_id, 8)
+    elif current_phase == 0:
+      conn.trafficlight.setPhase(light_id, 1)
+      conn.trafficlight.setPhaseDuration(light_id, 3)
+      skip_steps(3)
+      conn.trafficlight.setPhase(light_id, 3)
+    conn.trafficlight.setPhaseDuration(light_id, 3)
+    skip_steps(3)
+    conn.trafficlight.setPhase(light_id, 4)
+    conn.trafficlight.setPhaseDuration(light_id, 2)
+    skip_steps(2)
+    conn.trafficlight.setPhase(light_id, 5)
+    conn.trafficlight.setPhaseDuration(light_id, 99999)
+    skip_steps(5)
+
+
+@pytest.fixture(scope="module")
+def mcmaster():
+  # building the env does not start SUMO; only its transitions are used here
+  return load_env_class("McMaster")()
+
+
+def table(env, step_length=1.0):
+  return PhaseTransitionTable(env.action_phases, PROGRAM, env.phase_transitions, step_length)
+
+
+def test_mcmaster_table_runs_the_if_elif_chain(mcmaster):
+  transition_table = table(mcmaster)
+  for current_phase in range(len(PROGRAM)):
+    for action in range(len(mcmaster.action_phases)):
+      expected = FakeLight(current_phase)
+      if_elif_perform_action(expected, "tls", action, expected.skip_steps)
+      actual = FakeLight(current_phase)
+      transition_table.execute(actual, "tls", current_phase, action, actual.skip_steps)
+      assert actual.segments == expected.segments, (current_phase, action)
+
+
+def test_programmed_durations_are_not_resent():
+  transition_table = PhaseTransitionTable([0], PROGRAM, {(ANY, 0): [(2, 6, 6), (3, 4, 4), (0, HOLD, 5)]})
+  assert transition_table.table[1][0] == ((2, None, 6), (3, 4, 4), (0, HOLD, 5))
+
+
+def test_run_times_round_half_up_to_steps():
+  transitions = {(ANY, 0): [(CURRENT, 3, 3), (4, 2, 2), (0, HOLD, 5)]}
+  compiled = PhaseTransitionTable([0], PROGRAM, transitions, step_length=2).table[1][0]
+  assert [num_steps for _, _, num_steps in compiled] == [2, 1, 3]
+
+  compiled = PhaseTransitionTable([0], PROGRAM, transitions, step_length=0.5).table[1][0]
+  assert [num_steps for _, _, num_steps in compiled] == [6, 4, 10]
+
+  compiled = PhaseTransitionTable([0], PROGRAM, transitions, step_length=10).table[1][0]
+  assert [num_steps for _, _, num_steps in compiled] == [1, 1, 1] # every change runs at least one step
+
+
+def test_durations_cover_the_quantized_hold(mcmaster):
+  for step_length in (0.5, 1.0, 2.0, 4.0):
+    transition_table = table(mcmaster, step_length)
+    for row in transition_table.table:
+      for transition in row:
+        for phase, duration, num_steps in transition:
+          duration = PROGRAM[phase][1] if duration is None else duration
+          # SUMO must not switch the phase before the env is done holding it
+          assert duration >= num_steps * step_length, (step_length, phase)
+
+
+def test_unknown_phase_is_rejected():
+  with pytest.raises(ValueError):
+    PhaseTransitionTable([0], PROGRAM, {(ANY, 0): [(12, 3, 3), (0, HOLD, 5)]})
@@ -0,0 +1,86 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from trafficlightrl.stats import PerVehicleStat, QuantileSketch, RunningStats
+
+
+def test_running_stats_matches_numpy():
+  values = np.random.default_rng(0).normal(10, 3, size=500)
+  stats = RunningStats()
+  for value in values:
+    stats.add(value)
+
+  assert stats.count == len(values)
+  assert stats.mean == pytest.approx(values.mean())
+  assert stats.std == pytest.approx(values.std())
+  assert (stats.min, stats.max) == (values.min(), values.max())
+
+
+def test_batched_add_matches_repeated_values():
+  rng = np.random.default_rng(1)
+  values = rng.uniform(0, 20, size=50)
+  counts = rng.integers(1, 10, size=50)
+  stats = RunningStats()
+  for value, count in zip(values, counts):
+    stats.add(value, count)
+
+  expanded = np.repeat(values, counts)
+  assert stats.count == len(expanded)
+  assert stats.mean == pytest.approx(expanded.mean())
+  assert stats.variance == pytest.approx(expanded.var())
+
+
+def test_merge_matches_one_stream():
+  values = np.random.default_rng(2).exponential(5, size=300)
+  left, right, empty = RunningStats(), RunningStats(), RunningStats()
+  for value in values[:120]:
+    left.add(value)
+  for value in values[120:]:
+    right.add(value)
+  left.merge(right)
+  left.merge(empty)
+
+  assert left.count == len(values)
+  assert left.mean == pytest.approx(values.mean())
+  assert left.std == pytest.approx(values.std())
+  assert (left.min, left.max) == (values.min(), values.max())
+
+
+def test_quantiles_within_bucket_growth():
+  values = np.random.default_rng(3).lognormal(2, 1, size=2000)
+  sketch = QuantileSketch(growth=1.1)
+  for value in values:
+    sketch.add(value)
+
+  for q in (0.1, 0.5, 0.9, 0.99):
+    exact = np.quantile(values, q, method="lower")
+    # the upper edge of the bucket the exact quantile falls in
+    assert exact <= sketch.quantile(q) <= exact * 1.1
+
+
+def test_quantile_edge_cases():
+  sketch = QuantileSketch(minimum=0.1, maximum=100)
+  assert sketch.quantile(0.5) is None
+
+  for value in (0, 0, 0, 1e6):
+    sketch.add(value)
+  assert sketch.quantile(0.5) == 0.0
+  assert sketch.quantile(1) == sketch.edges[-1] # above maximum: the last bucket
+
+  copy = sketch.copy()
+  copy.add(5)
+  assert (sketch.count, copy.count) == (4, 5)
+
+
+def test_per_vehicle_stat_modes():
+  longest = PerVehicleStat("max")
+  total = PerVehicleStat("sum")
+  for vehicle_id, value in [("a", 1), ("a", 4), ("a", 2), ("b", 3)]:
+    longest.update(vehicle_id, value)
+    total.update(vehicle_id, value)
+  longest.retain(["b"])
+
+  assert longest.active == {"b": 3}
+  assert longest.summary()["max"] == 4 and longest.mean() == 3.5
+  assert total.total() == 10 and total.mean() == 5
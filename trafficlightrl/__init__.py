@@ -0,0 +1,7 @@
+"""
+Shared helpers for the campus SumoEnv classes (McMaster, Western, Queens, Waterloo, UofT).
+
+Each campus folder keeps its own SumoEnv (lanes, phases and routes are intersection specific);
+anything that is identical between them lives in this package instead of being copied five times.
+The campus scripts add the repository root to sys.path and import from here.
+"""
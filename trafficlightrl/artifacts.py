@@ -0,0 +1,130 @@
+import gzip
+import os
+import shutil
+import subprocess
+import xml.etree.ElementTree as ET
+import sumolib
+
+from trafficlightrl.cache import cache_dir, content_hash
+from trafficlightrl.demand import _open_xml
+
+
+INPUT_OPTIONS = ("net-file", "route-files", "additional-files", "gui-settings-file")
+
+# elements of an additional file that only draw something (OSM building / landuse shapes)
+SHAPE_TAGS = {"additional", "poly", "poi", "location", "param"}
+
+
+def _input_files(root, config_dir):
+  """option -> absolute paths of every input file the config names"""
+  inputs = {}
+  for element in root.iter():
+    if element.tag in INPUT_OPTIONS and element.get("value"):
+      inputs[element.tag] = [os.path.join(config_dir, path.strip()) for path in element.get("value").split(",")]
+  return inputs
+
+
+def _only_shapes(path):
+  with _open_xml(path) as f:
+    for _, element in ET.iterparse(f):
+      if element.tag not in SHAPE_TAGS:
+        return False
+      element.clear()
+  return True
+
+
+def _decompress(path, directory):
+  # returns the path relative to the artifact's config, so the artifact can be built elsewhere and moved into place
+  name = os.path.basename(path)[:-len(".gz")]
+  with gzip.open(path, "rb") as source, open(os.path.join(directory, name), "wb") as f:
+    shutil.copyfileobj(source, f)
+  return name
+
+
+def _build(sumo_config, directory, headless):
+  config_dir = os.path.dirname(os.path.abspath(sumo_config))
+  tree = ET.parse(sumo_config)
+  root = tree.getroot()
+  inputs = _input_files(root, config_dir)
+
+  for parent in list(root.iter()):
+    for element in list(parent):
+      if element.tag not in INPUT_OPTIONS or not element.get("value"):
+        continue
+      paths = inputs[element.tag]
+      if headless and element.tag == "gui-settings-file":
+        paths = []
+      elif headless and element.tag == "additional-files":
+        paths = [path for path in paths if not _only_shapes(path)]
+      paths = [_decompress(path, directory) if path.endswith(".gz") else path for path in paths]
+
+      if paths:
+        element.set("value", ",".join(paths))
+      else:
+        parent.remove(element)
+  for gui_only in root.findall("gui_only"):
+    if headless and not len(gui_only):
+      root.remove(gui_only)
+
+  # the inputs are validated once below, not on every start / load
+  input_section = root.find("input")
+  if input_section is None:
+    input_section = ET.SubElement(root, "input")
+  for option in ("xml-validation", "xml-validation.net", "xml-validation.routes"):
+    for element in root.iter(option):
+      element.set("value", "never")
+    if next(root.iter(option), None) is None:
+      ET.SubElement(input_section, option, value="never")
+
+  config_file = os.path.join(directory, os.path.basename(sumo_config))
+  tree.write(config_file, encoding="UTF-8", xml_declaration=True)
+
+  subprocess.run([
+    sumolib.checkBinary("sumo"), "-c", config_file, "--end", "0",
+    "--xml-validation", "auto", "--xml-validation.net", "auto", "--xml-validation.routes", "auto",
+    "--no-step-log", "true",
+    "--no-warnings", "true"
+  ], check=True, stdout=subprocess.DEVNULL)
+  return config_file
+
+
+def prepared_config(sumo_config, headless=True):
+  """
+  Ready-to-load copy of a .sumocfg from the network artifact cache, built the first time its content is seen.
+
+  Every traci.start / traci.load of the original config re-reads whatever it names as it is: UofT's network and
+  polygons are gzipped, so each one gunzips (and schema-validates) them again. The artifact stores the inputs
+  decompressed, is validated once when it is built (SUMO is told not to validate it again), and with headless=True
+  leaves out what only sumo-gui uses: the GUI settings and additional files that hold nothing but polygons / POIs.
+  Artifacts live under cache_dir("networks"), keyed by a content hash of the config and every file it names, so a
+  changed network gets a new artifact and every env and worker with the same inputs shares one.
+  """
+  config_dir = os.path.dirname(os.path.abspath(sumo_config))
+  with open(sumo_config, "rb") as f:
+    config_bytes = f.read()
+  parts = [config_bytes, config_dir, headless]
+  for option, paths in sorted(_input_files(ET.fromstring(config_bytes), config_dir).items()):
+    for path in paths:
+      with open(path, "rb") as f:
+        parts += [option, f.read()]
+  key = content_hash(*parts)
+
+  name = os.path.splitext(os.path.basename(sumo_config))[0]
+  directory = os.path.join(cache_dir("networks"), f"{name}_{key}")
+  config_file = os.path.join(directory, os.path.basename(sumo_config))
+  if os.path.exists(config_file):
+    return config_file
+
+  # build in a private directory first so concurrent workers never load a half-written artifact
+  tmp_directory = f"{directory}.{os.getpid()}.tmp"
+  os.makedirs(tmp_directory, exist_ok=True)
+  try:
+    _build(sumo_config, tmp_directory, headless)
+    try:
+      os.rename(tmp_directory, directory)
+    except OSError: # another worker finished the same artifact first
+      pass
+  finally:
+    if os.path.exists(tmp_directory):
+      shutil.rmtree(tmp_directory)
+  return config_file
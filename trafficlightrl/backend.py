@@ -0,0 +1,55 @@
+import itertools
+import os
+import sumolib
+import traci
+
+
+# used to hand out connection labels that are unique within this process
+_label_counter = itertools.count()
+
+
+def load_backend(use_gui=False, use_libsumo=True):
+  """
+  Returns the module the env uses to talk to SUMO.
+
+  libsumo runs SUMO inside this python process with the same API as traci, so every query is a function call
+  instead of a socket round-trip. It cannot drive sumo-gui though, so it is only picked for headless runs
+  (and only if it is installed) - everything else falls back to traci. libsumo also holds a single simulation per
+  process, so while another env's is loaded this env gets traci too and leaves that simulation running.
+  """
+  if use_libsumo and not use_gui:
+    try:
+      import libsumo
+      if not libsumo.isLoaded():
+        return libsumo
+    except ImportError:
+      pass
+
+  return traci
+
+
+def is_libsumo(backend):
+  return backend.__name__ == "libsumo"
+
+
+def new_label(prefix="sumo_env"):
+  """Connection label that no other env in this process (or in another worker process) will use"""
+  return f"{prefix}_{os.getpid()}_{next(_label_counter)}"
+
+
+def connect(backend, cmd, label):
+  """
+  Starts SUMO with the given command line and returns the handle the env should make every call on.
+
+  With traci each env gets its own labelled connection on a free port, so any number of envs can run in one
+  process or on one machine (e.g. one SUMO per SubprocVecEnv worker). libsumo can only hold a single simulation
+  per process, so there the module itself is the handle - use one env per worker process.
+  """
+  if is_libsumo(backend):
+    if backend.isLoaded(): # another env started its simulation after this one picked libsumo
+      raise RuntimeError(f"libsumo already runs a simulation in this process, create the env for {label} with use_libsumo=False")
+    backend.start(cmd)
+    return backend
+
+  backend.start(cmd, port=sumolib.miscutils.getFreeSocketPort(), label=label)
+  return backend.getConnection(label)
@@ -0,0 +1,115 @@
+import os
+import subprocess
+import tempfile
+import sumolib
+
+from trafficlightrl.backend import new_label
+from trafficlightrl.demand import RandomDemand
+from trafficlightrl.outputs import parse_emissions, parse_summary, parse_tripinfo
+
+
+def run_fixed_time(sumo_config, edge_mapping, spawn_rate, max_cars, seed, max_time=1000, label=None, use_emission_output=True, lane_ids=None):
+  """
+  Runs one fixed-time episode in a plain `sumo` process (no TraCI at all) and returns its episode metrics.
+
+  The random cars are the cached demand schedule for `seed` (the same cars an env with demand_seed sees), the traffic
+  light keeps the signal program from the network, and every metric comes from SUMO's own outputs.
+
+  By default they are read from SUMO's per-vehicle, per-step emission output, which carries everything the env's own
+  definitions need (longest single wait per vehicle, stopped vehicles per step without the ones just departing, mean
+  vehicle speed per step, integrated CO2; per-vehicle values on lane_ids only, the env's controlled lanes, or the whole
+  network without them) - the output is large but streamed, never loaded whole.
+  use_emission_output=False reads the much smaller tripinfo and summary outputs instead (see episode_metrics); their
+  values are defined differently, so they come under other keys.
+  """
+  label = label if label else new_label("baseline")
+  demand = RandomDemand(edge_mapping, spawn_rate, max_cars, sumo_config, label)
+  tripinfo_file = os.path.join(tempfile.gettempdir(), f"{label}.tripinfo.xml")
+  summary_file = os.path.join(tempfile.gettempdir(), f"{label}.summary.xml")
+  emission_file = os.path.join(tempfile.gettempdir(), f"{label}.emission.xml")
+
+  try:
+    route_args = demand.write(seed)
+
+    # the env stops once every car is deployed and either max_time is reached or the network is empty;
+    # plain sumo stops by itself when the network is empty, so only the time limit needs to be passed
+    end_time = max(max_time, int(demand.departures[-1]) + 1)
+
+    if use_emission_output:
+      output_args = ["--emission-output", emission_file]
+    else:
+      output_args = [
+        "--tripinfo-output", tripinfo_file,
+        "--tripinfo-output.write-unfinished", "true",
+        "--device.emissions.probability", "1",
+        "--summary-output", summary_file
+      ]
+
+    subprocess.run([
+      sumolib.checkBinary("sumo"), "-c", sumo_config, *route_args,
+      "--end", str(end_time),
+      *output_args,
+      "--no-step-log", "true",
+      "--no-warnings", "true"
+    ], check=True, stdout=subprocess.DEVNULL)
+
+    if use_emission_output:
+      metrics = parse_emissions(emission_file, lane_ids=lane_ids)
+      return _info(metrics["wait_time_stats"], metrics["total_congestion_avg"], metrics["total_speed_avg"], metrics["emission_stats"])
+    return episode_metrics(tripinfo_file, summary_file)
+  finally:
+    demand.cleanup()
+    for path in (tripinfo_file, summary_file, emission_file):
+      if os.path.exists(path):
+        os.remove(path)
+
+
+def episode_metrics(tripinfo_file, summary_file):
+  """
+  Episode metrics from the tripinfo and summary outputs.
+
+  They are not the env's definitions: the wait time is the accumulated waiting time per vehicle (not its longest single
+  wait), congestion is SUMO's halting count (speed < 0.1 m/s, departing vehicles included) and the speed is the summary's
+  mean speed; the emissions cover each whole trip, not only the controlled lanes. So they are returned under their own
+  keys instead of the env's wait_time_stats / total_congestion_avg / total_speed_avg / lane_emission_totals, which would
+  invite a comparison with the RL numbers.
+  """
+  wait_time_stats, emission_stats = parse_tripinfo(tripinfo_file)
+  congestion_avg, speed_avg = parse_summary(summary_file)
+  return {
+    "accumulated_wait_time_stats": wait_time_stats.summary(),
+    "halting_avg": congestion_avg,
+    "mean_speed_avg": speed_avg,
+    "trip_emission_totals": { # mg per trip, whole network
+      "total": {pollutant: stats.total() for pollutant, stats in emission_stats.items()},
+      "per_vehicle": {pollutant: stats.mean() for pollutant, stats in emission_stats.items()}
+    }
+  }
+
+
+def _info(wait_time_stats, congestion_avg, speed_avg, emission_stats):
+  return {
+    "wait_time_stats": wait_time_stats.summary(),
+    "total_congestion_avg": congestion_avg,
+    "total_speed_avg": speed_avg,
+    "lane_emission_totals": { # same layout as the envs' (the emission output has no per-lane split)
+      "lanes_total": {pollutant: stats.total() for pollutant, stats in emission_stats.items()},
+      "per_vehicle_on_lanes": {pollutant: stats.mean() for pollutant, stats in emission_stats.items()},
+      "lanes": {}
+    },
+    "emissions": emission_stats["CO2"].mean() # mean CO2 per vehicle on the controlled lanes (mg), Western's info["emissions"]
+  }
+
+
+def evaluate_fixed_time(env, episodes, demand_seed=0, use_emission_output=True):
+  """
+  Fixed-time ("traditional system") half of a comparison sweep for a campus env, at native simulator speed.
+
+  Uses the env's network, routes, spawn rate and max_cars; episode n uses the demand schedule for demand_seed + n,
+  matching an RL env created with the same demand_seed. Returns one metrics dict per episode.
+  """
+  max_time = getattr(env, "max_wait_time", 1000)
+  return [
+    run_fixed_time(env.sumo_config, env.edge_mapping, env.car_spawn_rate, env.max_cars, demand_seed + episode, max_time=max_time, label=f"{env.label}_baseline_{episode}", use_emission_output=use_emission_output, lane_ids=list(env.lanes))
+    for episode in range(episodes)
+  ]
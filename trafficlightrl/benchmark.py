@@ -0,0 +1,159 @@
+"""
+Step-throughput benchmark for the campus SumoEnv classes.
+
+Runs each env headless with random actions at fixed seeds and spawn rates and reports env steps/sec,
+simulated seconds per wall-clock second, reset latency and TraCI calls per step. Results are written as JSON
+so two runs (e.g. before and after an env change) can be compared:
+
+  python -m trafficlightrl.benchmark --output bench.json
+  python -m trafficlightrl.benchmark --campuses McMaster Western --spawn-rates 0.2 0.6 --baseline bench.json
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import sys
+import time
+import numpy as np
+
+from trafficlightrl.backend import is_libsumo
+from trafficlightrl.instrumentation import Instrumentation, InstrumentedConnection
+
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# file that defines each campus SumoEnv (they are all called SumoEnv, so they are loaded by path)
+CAMPUS_ENVS = {
+  "McMaster": "McMaster/simulate.py",
+  "Western": "Western/simulate.py",
+  "Queens": "Queens/simulate.py",
+  "Waterloo": "Waterloo/simulate.py",
+  "UofT": "UofT/agent.py"
+}
+
+
+def load_env_class(campus):
+  path = os.path.join(REPO_ROOT, CAMPUS_ENVS[campus])
+  spec = importlib.util.spec_from_file_location(f"{campus.lower()}_env", path)
+  module = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(module)
+  return module.SumoEnv
+
+
+def benchmark_env(campus, spawn_rate, seed=0, episodes=2, max_steps=500, use_libsumo=True, use_sumo_demand=False):
+  """Runs `episodes` episodes of at most `max_steps` env steps and returns the timing summary (cars replay the cached demand for `seed`)"""
+  env_class = load_env_class(campus)
+  env = env_class(use_gui=False, use_random=True, use_actions=True, spawn_rate=spawn_rate, use_libsumo=use_libsumo, use_sumo_demand=use_sumo_demand, demand_seed=seed)
+  env.action_space.seed(seed)
+  use_libsumo = is_libsumo(env.backend) # what the env really runs on (traci without libsumo installed)
+
+  instrumentation = Instrumentation()
+  reset_times = []
+  steps = 0
+  sim_seconds = 0.0
+  step_wall_time = 0.0
+  calls = 0
+
+  try:
+    for episode in range(episodes):
+      start = time.perf_counter()
+      env.reset(seed=seed + episode)
+      reset_times.append(time.perf_counter() - start)
+
+      # the first reset launches SUMO; count every call from then on
+      if not isinstance(env.sumo, InstrumentedConnection):
+        env.sumo = InstrumentedConnection(env.sumo, instrumentation)
+      calls_before = instrumentation.total_calls
+      sim_start = env.sumo._conn.simulation.getTime()
+
+      start = time.perf_counter()
+      for _ in range(max_steps):
+        _, _, done, truncated, _ = env.step(env.action_space.sample())
+        steps += 1
+        if done or truncated:
+          break
+      step_wall_time += time.perf_counter() - start
+
+      sim_seconds += env.sumo._conn.simulation.getTime() - sim_start
+      calls += instrumentation.total_calls - calls_before
+  finally:
+    env.close()
+
+  return {
+    "campus": campus,
+    "spawn_rate": spawn_rate,
+    "seed": seed,
+    "libsumo": use_libsumo,
+    "sumo_demand": use_sumo_demand,
+    "episodes": episodes,
+    "steps": steps,
+    "steps_per_sec": steps / step_wall_time if step_wall_time else None,
+    "sim_seconds_per_sec": sim_seconds / step_wall_time if step_wall_time else None,
+    "start_latency": reset_times[0], # first reset starts SUMO
+    "reset_latency": float(np.mean(reset_times[1:])) if len(reset_times) > 1 else None,
+    "traci_calls_per_step": calls / steps if steps else None
+  }
+
+
+def _run_key(result):
+  # runs are only comparable on the same backend and demand path
+  return result["campus"], result["spawn_rate"], result.get("libsumo"), result.get("sumo_demand", False)
+
+
+def compare(results, baseline, tolerance=0.1):
+  """Prints the steps/sec change against a previous results file; returns the runs that got slower than tolerance"""
+  previous = {_run_key(r): r for r in baseline["results"]}
+  regressions = []
+  for result in results:
+    old = previous.get(_run_key(result))
+    if not old or not old["steps_per_sec"] or not result["steps_per_sec"]:
+      continue
+
+    change = result["steps_per_sec"] / old["steps_per_sec"] - 1
+    print(f"{result['campus']:>9} @ {result['spawn_rate']:.3f}: {old['steps_per_sec']:.1f} -> {result['steps_per_sec']:.1f} steps/sec ({change:+.1%})")
+    if change < -tolerance:
+      regressions.append(result)
+  return regressions
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Benchmark SumoEnv step throughput")
+  parser.add_argument("--campuses", nargs="+", default=list(CAMPUS_ENVS), choices=list(CAMPUS_ENVS))
+  parser.add_argument("--spawn-rates", nargs="+", type=float, default=[0.1, 0.3, 0.6])
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument("--episodes", type=int, default=2)
+  parser.add_argument("--max-steps", type=int, default=500)
+  parser.add_argument("--no-libsumo", action="store_true", help="always use traci (socket) even if libsumo is installed")
+  parser.add_argument("--sumo-demand", action="store_true", help="let SUMO insert the random cars from a route file (use_sumo_demand)")
+  parser.add_argument("--output", default="benchmark.json")
+  parser.add_argument("--baseline", help="previous results file to compare steps/sec against")
+  parser.add_argument("--tolerance", type=float, default=0.1, help="allowed steps/sec slowdown before --baseline fails")
+  args = parser.parse_args(argv)
+
+  results = []
+  for campus in args.campuses:
+    for spawn_rate in args.spawn_rates:
+      result = benchmark_env(campus, spawn_rate, seed=args.seed, episodes=args.episodes, max_steps=args.max_steps, use_libsumo=not args.no_libsumo, use_sumo_demand=args.sumo_demand)
+      print(f"{campus:>9} @ {spawn_rate:.3f}: {result['steps_per_sec']:.1f} steps/sec, {result['sim_seconds_per_sec']:.1f} sim-s/sec, {result['traci_calls_per_step']:.1f} calls/step")
+      results.append(result)
+
+  with open(args.output, "w") as f:
+    json.dump({
+      "python": platform.python_version(),
+      "platform": platform.platform(),
+      "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+      "config": vars(args),
+      "results": results
+    }, f, indent=2)
+
+  if args.baseline:
+    with open(args.baseline) as f:
+      regressions = compare(results, json.load(f), tolerance=args.tolerance)
+    if regressions:
+      return 1
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
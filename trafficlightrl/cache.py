@@ -0,0 +1,24 @@
+import hashlib
+import os
+
+
+def cache_dir(kind):
+  """
+  Directory for one kind of on-disk cache (e.g. "demand"), created on first use.
+
+  Everything lives under $TRAFFICLIGHTRL_CACHE (default ~/.cache/trafficlightrl), so a cache can be shared by all
+  envs and worker processes on a machine and wiped by deleting one folder.
+  """
+  root = os.environ.get("TRAFFICLIGHTRL_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "trafficlightrl"))
+  path = os.path.join(root, kind)
+  os.makedirs(path, exist_ok=True)
+  return path
+
+
+def content_hash(*parts, length=12):
+  """Short stable hash of strings/bytes (used to key cache entries on their inputs)"""
+  digest = hashlib.sha256()
+  for part in parts:
+    digest.update(part if isinstance(part, bytes) else str(part).encode())
+    digest.update(b"\0")
+  return digest.hexdigest()[:length]
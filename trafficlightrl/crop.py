@@ -0,0 +1,116 @@
+import math
+import os
+import subprocess
+import xml.etree.ElementTree as ET
+import sumolib
+
+from trafficlightrl.cache import cache_dir, content_hash
+from trafficlightrl.demand import config_inputs
+
+
+def _distance(point, center):
+  return math.hypot(point[0] - center[0], point[1] - center[1])
+
+
+def crop_edges(net, lanes, edge_mapping, radius):
+  """
+  Edges of the cropped network: every edge with a shape point within radius (m) of the controlled intersection, every
+  edge of its junction(s), the start and end edges of edge_mapping and the shortest path between each pair of them.
+  The intersection is the node(s) the controlled lanes lead to.
+  """
+  lane_edges = {net.getLane(lane_id).getEdge() for lane_id in lanes}
+  nodes = {edge.getToNode() for edge in lane_edges}
+  center = (
+    sum(node.getCoord()[0] for node in nodes) / len(nodes),
+    sum(node.getCoord()[1] for node in nodes) / len(nodes)
+  )
+
+  keep = set(lane_edges)
+  for node in nodes: # the whole junction, so the light's link indices (and every phase state) stay the same
+    keep.update(node.getIncoming())
+    keep.update(node.getOutgoing())
+  for edge in net.getEdges():
+    if any(_distance(point, center) <= radius for point in edge.getShape()):
+      keep.add(edge)
+
+  for start_edge, end_edges in edge_mapping.items():
+    if not net.hasEdge(start_edge):
+      continue
+    for end_edge in end_edges:
+      if not net.hasEdge(end_edge):
+        continue
+      path, _ = net.getShortestPath(net.getEdge(start_edge), net.getEdge(end_edge))
+      keep.update(path if path else (net.getEdge(start_edge), net.getEdge(end_edge)))
+
+  return sorted(edge.getID() for edge in keep)
+
+
+def _write_config(sumo_config, net_file, path, keep_polygons):
+  """Copy of sumo_config that loads net_file, with every other input made absolute (and the polygons dropped unless keep_polygons)"""
+  config_dir = os.path.dirname(os.path.abspath(sumo_config))
+  tree = ET.parse(sumo_config)
+  root = tree.getroot()
+
+  for parent in list(root.iter()):
+    for element in list(parent):
+      value = element.get("value")
+      if element.tag == "net-file":
+        element.set("value", net_file)
+      elif element.tag == "additional-files" and not keep_polygons:
+        parent.remove(element)
+      elif element.tag in ("route-files", "additional-files", "gui-settings-file") and value:
+        element.set("value", ",".join(os.path.join(config_dir, file.strip()) for file in value.split(",")))
+
+  # trips of the config's own route files that ran over a cropped edge are dropped instead of stopping the simulation
+  processing = root.find("processing")
+  if processing is None:
+    processing = ET.SubElement(root, "processing")
+  if processing.find("ignore-route-errors") is None:
+    ET.SubElement(processing, "ignore-route-errors", value="true")
+
+  tree.write(path, encoding="UTF-8", xml_declaration=True)
+
+
+def crop_network(sumo_config, lanes, edge_mapping, radius=200.0, keep_polygons=False):
+  """
+  .sumocfg of the network cropped to radius metres around the controlled intersection, built once and cached.
+
+  The campus networks are whole OSM exports, while an env only observes one intersection: netconvert keeps the edges
+  from crop_edges (so every random car's route still exists) and drops the rest, and the config leaves out the
+  polygons (additional-files) unless keep_polygons (sumo-gui). Trips of the config's own route files that used a
+  cropped edge are dropped by SUMO. The result is keyed on the network, the config, the lanes, edge_mapping, radius
+  and keep_polygons under cache_dir("networks"), so every env and worker with the same inputs shares it.
+  """
+  net_file, _ = config_inputs(sumo_config)
+  with open(net_file, "rb") as f:
+    net_bytes = f.read()
+  with open(sumo_config, "rb") as f:
+    config_bytes = f.read()
+  net_key = content_hash(net_bytes, sorted(lanes), list(edge_mapping.items()), radius)
+  config_key = content_hash(net_key, config_bytes, os.path.abspath(sumo_config), keep_polygons)
+
+  directory = cache_dir("networks")
+  name = os.path.splitext(os.path.basename(sumo_config))[0]
+  cropped_config = os.path.join(directory, f"{name}_crop_{config_key}.sumocfg")
+  if os.path.exists(cropped_config):
+    return cropped_config
+
+  cropped_net = os.path.join(directory, f"{name}_crop_{net_key}.net.xml") # shared by the headless and the sumo-gui config
+  if not os.path.exists(cropped_net):
+    net = sumolib.net.readNet(net_file)
+    keep_edges = crop_edges(net, lanes, edge_mapping, radius)
+
+    # write to private files first so concurrent workers never load a half-written network
+    tmp_net = f"{cropped_net}.{os.getpid()}.tmp.net.xml"
+    subprocess.run([
+      sumolib.checkBinary("netconvert"), "-s", net_file,
+      "--keep-edges.explicit", ",".join(keep_edges),
+      "-o", tmp_net,
+      "--no-warnings", "true"
+    ], check=True, stdout=subprocess.DEVNULL)
+    os.replace(tmp_net, cropped_net)
+
+  tmp_config = f"{cropped_config}.{os.getpid()}.tmp"
+  _write_config(sumo_config, cropped_net, tmp_config, keep_polygons)
+  os.replace(tmp_config, cropped_config)
+  return cropped_config
@@ -0,0 +1,47 @@
+class DecisionPoints:
+  """
+  When the agent is asked for its next action in event-driven mode (use_decision_points=True).
+
+  Instead of one decision per simulation step, the env keeps stepping the simulation (with the traffic light left as the
+  last action set it) until one of these happens, and returns the reward accumulated over the skipped steps:
+    - the current phase has been shown for min_green seconds (the first moment the light may be switched again);
+    - after that, the number of halting vehicles on the controlled lanes has changed by queue_threshold or more since the
+      last decision (None = never);
+    - after that, decision_interval seconds have passed since the last decision (None = never).
+  Times are simulation seconds, so the decision points do not depend on the step length.
+  """
+
+  def __init__(self, min_green=10, decision_interval=30, queue_threshold=3):
+    if decision_interval is None and queue_threshold is None: # the agent would never be asked again after the first green
+      raise ValueError("decision_interval and queue_threshold cannot both be None")
+    self.min_green = min_green
+    self.decision_interval = decision_interval
+    self.queue_threshold = queue_threshold
+    self.reset(0, None, 0)
+
+  def reset(self, time, phase, queue):
+    # the state at a decision the agent has just been asked for (also the start of the episode)
+    self.phase = phase
+    self.phase_start = time # when the current phase was first seen
+    self.decision_time = time
+    self.decision_queue = queue
+
+  def is_decision_point(self, time, phase, queue):
+    """Call once per simulation step; True (and records the decision) when the agent should be asked again"""
+    if phase != self.phase:
+      self.phase = phase
+      self.phase_start = time
+
+    green_end = self.phase_start + self.min_green
+    if time < green_end:
+      return False
+
+    decide = (
+      self.decision_time < green_end # minimum green just elapsed (no decision since)
+      or (self.queue_threshold is not None and abs(queue - self.decision_queue) >= self.queue_threshold)
+      or (self.decision_interval is not None and time - self.decision_time >= self.decision_interval)
+    )
+    if decide:
+      self.decision_time = time
+      self.decision_queue = queue
+    return decide
@@ -0,0 +1,164 @@
+import gzip
+import math
+import os
+import tempfile
+import xml.etree.ElementTree as ET
+import numpy as np
+
+from trafficlightrl.cache import cache_dir, content_hash
+
+
+# one row per random car: departure (simulation second / spawn opportunity), start edge index into edge_mapping,
+# end edge index into that start edge's list, and desired speed
+SCHEDULE_DTYPE = np.dtype([("depart", np.int64), ("start", np.int16), ("end", np.int16), ("speed", np.float32)])
+
+
+def _open_xml(path):
+  return gzip.open(path) if path.endswith(".gz") else open(path, "rb")
+
+
+def config_inputs(sumo_config):
+  """Absolute paths of the net file and route files a .sumocfg points at (they are relative to the config)"""
+  config_dir = os.path.dirname(os.path.abspath(sumo_config))
+  inputs = {}
+  for element in ET.parse(sumo_config).getroot().iter():
+    if element.tag in ("net-file", "route-files"):
+      inputs[element.tag] = [os.path.join(config_dir, path.strip()) for path in element.get("value").split(",")]
+  return inputs.get("net-file", [None])[0], inputs.get("route-files", [])
+
+
+def edge_speeds(net_file, edge_ids):
+  """Speed limit (of lane 0) of each requested edge, streamed from the network file without loading it whole"""
+  edge_ids = set(edge_ids)
+  speeds = {}
+  with _open_xml(net_file) as f:
+    for _, element in ET.iterparse(f):
+      if element.tag == "edge":
+        if element.get("id") in edge_ids:
+          speeds[element.get("id")] = float(element.find("lane").get("speed"))
+        element.clear()
+  return speeds
+
+
+def route_departures(route_files):
+  """
+  Sorted departure times of every <vehicle> / <trip> in the route files, streamed without loading them whole.
+
+  None if the files also insert vehicles some other way (flows, persons, non-numeric departs such as "triggered"),
+  i.e. when the departures cannot be known in advance.
+  """
+  departures = []
+  for route_file in route_files:
+    with _open_xml(route_file) as f:
+      for _, element in ET.iterparse(f):
+        if element.tag in ("vehicle", "trip"):
+          try:
+            departures.append(float(element.get("depart")))
+          except (TypeError, ValueError):
+            return None
+        elif element.tag in ("flow", "person", "personFlow", "container", "containerFlow"):
+          return None
+        element.clear()
+  return np.sort(np.array(departures, dtype=np.float64))
+
+
+def steps_before(departures, current_time, step_length):
+  """
+  Simulation steps that can run from current_time before the next of the (sorted) departures is inserted: a step
+  ending at T inserts the vehicles with depart < T. math.inf if none is left.
+  """
+  i = np.searchsorted(departures, current_time, side="left")
+  if i == len(departures):
+    return math.inf
+  return int((departures[i] - current_time) // step_length)
+
+
+def sample_schedule(edge_mapping, spawn_rate, max_cars, seed, speed_range=(5, 15)):
+  """
+  One episode of random cars, drawn the way the per-step spawning draws them: a car spawns with probability
+  spawn_rate on every simulation second (geometric gaps) until max_cars have spawned, on a uniform start edge,
+  a uniform end edge of that start edge and a uniform desired speed.
+  """
+  rng = np.random.default_rng(seed)
+  num_end_edges = np.array([len(end_edges) for end_edges in edge_mapping.values()])
+
+  schedule = np.zeros(max_cars, dtype=SCHEDULE_DTYPE)
+  schedule["depart"] = np.cumsum(rng.geometric(spawn_rate, size=max_cars)) - 1 # first step is at t=0
+  schedule["start"] = rng.integers(len(edge_mapping), size=max_cars)
+  schedule["end"] = rng.integers(num_end_edges[schedule["start"]])
+  schedule["speed"] = rng.uniform(*speed_range, size=max_cars)
+  return schedule
+
+
+def load_schedule(edge_mapping, spawn_rate, max_cars, seed, speed_range=(5, 15)):
+  """
+  The schedule for (routes, spawn_rate, max_cars, seed), generated once and memory-mapped from the on-disk cache afterwards.
+
+  Every env that asks for the same key - an RL run and its fixed-time baseline, or the same sweep point in another
+  worker - replays exactly the same cars without drawing a single random number.
+  """
+  key = content_hash(list(edge_mapping.items()), speed_range)
+  path = os.path.join(cache_dir("demand"), f"{key}_{max_cars}_{spawn_rate:.6f}_{seed}.npy")
+
+  if not os.path.exists(path):
+    # write to a private file first so concurrent workers never read a half-written schedule
+    tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+    np.save(tmp_path, sample_schedule(edge_mapping, spawn_rate, max_cars, seed, speed_range))
+    os.replace(tmp_path, path)
+
+  return np.load(path, mmap_mode="r")
+
+
+class RandomDemand:
+  """
+  SUMO-native replacement for spawn_random_car: the whole episode's random cars are written to a seeded route file
+  that SUMO inserts by itself, so no route.add / vehicle.add / vehicle.setSpeed round-trips happen during the episode.
+
+  The cars come from the cached schedule for the episode's seed (see sample_schedule for the arrival process) and are
+  written as trips, so SUMO routes each start/end pair on insertion the way vehicle.add() does for a disconnected route.
+  Trips SUMO cannot route are skipped (--ignore-route-errors) like the TraCIException spawn_random_car swallows.
+
+  The speed is an approximation: setSpeed() holds a car at its speed on every lane, whatever the limit, while the
+  speedFactor written here scales each lane's limit and only matches the drawn speed on the start edge.
+  """
+
+  def __init__(self, edge_mapping, spawn_rate, max_cars, sumo_config, label, speed_range=(5, 15)):
+    self.edge_mapping = edge_mapping
+    self.start_edges = list(edge_mapping)
+    self.spawn_rate = spawn_rate
+    self.max_cars = max_cars
+    self.speed_range = speed_range
+
+    net_file, self.route_files = config_inputs(sumo_config)
+    self.start_speeds = edge_speeds(net_file, self.start_edges)
+
+    self.route_file = os.path.join(tempfile.gettempdir(), f"{label}.demand.rou.xml")
+    self.departures = np.zeros(0)
+
+  def write(self, seed):
+    """Writes the episode's route file and returns the SUMO options that load it (next to the config's own routes)"""
+    schedule = load_schedule(self.edge_mapping, self.spawn_rate, self.max_cars, seed, self.speed_range)
+
+    with open(self.route_file, "w") as f:
+      f.write("<routes>\n")
+      for i, (depart, start, end, speed) in enumerate(schedule.tolist()):
+        start_edge = self.start_edges[start]
+        end_edge = self.edge_mapping[start_edge][end]
+        speed_factor = speed / self.start_speeds[start_edge]
+        f.write(f'  <trip id="rand_car_{i}" depart="{depart:.2f}" from="{start_edge}" to="{end_edge}" speedFactor="{speed_factor:.4f}"/>\n')
+      f.write("</routes>\n")
+
+    self.departures = schedule["depart"]
+    return ["--route-files", ",".join(self.route_files + [self.route_file]), "--ignore-route-errors"]
+
+  def deployed_count(self, current_time):
+    """Number of cars spawned before the step that ended at current_time (what deployed_counter counted with per-step spawning)"""
+    return int(np.searchsorted(self.departures, current_time, side="left"))
+
+  def idle_steps(self, current_time, step_length):
+    """Simulation steps before the next car of the route file (math.inf once every car has departed)"""
+    return steps_before(self.departures, current_time, step_length)
+
+  def cleanup(self):
+    if os.path.exists(self.route_file):
+      os.remove(self.route_file)
@@ -0,0 +1,64 @@
+from traci import constants as tc
+
+from trafficlightrl.stats import PerVehicleStat
+
+
+# pollutant name -> TraCI variable (the same variable exists for vehicles and lanes); SUMO reports mg/s
+# (fuel too since SUMO 1.14, ml/s before that)
+POLLUTANTS = {
+  "CO2": tc.VAR_CO2EMISSION,
+  "NOx": tc.VAR_NOXEMISSION,
+  "fuel": tc.VAR_FUELCONSUMPTION
+}
+
+
+class EmissionAccounting:
+  """
+  Emissions integrated over time (rate x step length) for one episode on the controlled lanes, per vehicle and per lane.
+
+  The rates come from subscriptions only: the VehicleBookkeeper passes the subscribed rates of each vehicle on the
+  lanes to add_vehicle() and finalizes vehicles once they leave them, and the observer's lane subscriptions (the summed rate of the
+  vehicles on each lane) go to add_lanes(). Nothing here calls TraCI.
+  """
+
+  def __init__(self, pollutants=("CO2",)):
+    self.pollutants = list(pollutants)
+    self.variables = [POLLUTANTS[pollutant] for pollutant in self.pollutants]
+    self.vehicle_stats = {pollutant: PerVehicleStat("sum") for pollutant in self.pollutants} # mg per vehicle
+    self.lane_totals = {} # lane_id -> {pollutant: mg}
+
+  def reset(self):
+    for stats in self.vehicle_stats.values():
+      stats.reset()
+    self.lane_totals = {}
+
+  def add_vehicle(self, vehicle_id, values, step_length):
+    for pollutant, variable in zip(self.pollutants, self.variables):
+      self.vehicle_stats[pollutant].update(vehicle_id, values[variable] * step_length)
+
+  def finalize(self, vehicle_ids):
+    for stats in self.vehicle_stats.values():
+      stats.evict(vehicle_ids)
+
+  def add_lanes(self, lane_results, lane_ids, step_length):
+    # only the observer's own lanes: other envs on the same connection (a tiled network) subscribe lanes too
+    for lane_id in lane_ids:
+      values = lane_results[lane_id]
+      totals = self.lane_totals.setdefault(lane_id, dict.fromkeys(self.pollutants, 0.0))
+      for pollutant, variable in zip(self.pollutants, self.variables):
+        totals[pollutant] += values[variable] * step_length
+
+  def mean_per_vehicle(self, pollutant="CO2"):
+    return self.vehicle_stats[pollutant].mean() if pollutant in self.vehicle_stats else 0
+
+  def summary(self):
+    """
+    Plain dict of the episode so far: the controlled-lane totals, their mean per vehicle and the totals on each lane.
+
+    Vehicles are only integrated while they are on the controlled lanes, so none of it covers the rest of the network.
+    """
+    return {
+      "lanes_total": {pollutant: stats.total() for pollutant, stats in self.vehicle_stats.items()},
+      "per_vehicle_on_lanes": {pollutant: stats.mean() for pollutant, stats in self.vehicle_stats.items()},
+      "lanes": {lane_id: dict(totals) for lane_id, totals in self.lane_totals.items()}
+    }
@@ -0,0 +1,31 @@
+import math
+
+from trafficlightrl.demand import config_inputs, route_departures, steps_before
+
+
+class IdleFastForward:
+  """
+  Runs the simulation steps in which nothing can happen in a single simulationStep(time) call.
+
+  While no vehicle is on the network or waiting to be inserted, the steps up to the next departure only advance the
+  clock, so they are jumped over instead of paying for an env step (observation, reward, metrics) each. The next
+  departure has to be known in advance: the config's own route files are read once (vehicles/trips with a numeric
+  depart - with flows nothing is skipped) and the env passes the steps before its own next random car.
+  Nothing departs or arrives during a jump, so the subscriptions (and the per-vehicle records) miss nothing.
+  """
+
+  def __init__(self, sumo_config):
+    _, route_files = config_inputs(sumo_config)
+    self.departures = route_departures(route_files) if route_files else []
+
+  def steps(self, conn, current_time, step_length, spawn_steps):
+    """Steps that can be jumped from current_time (0 = none); spawn_steps: steps before the env's next random car"""
+    if self.departures is None: # the config's demand is not known in advance
+      return 0
+    steps = min(steps_before(self.departures, current_time, step_length), spawn_steps)
+    if steps <= 0 or steps == math.inf: # a car is due, or nothing will come anymore (the episode is over)
+      return 0
+    # the observer's vehicle records may be a few steps old (e.g. after an action's yellow phases), so ask SUMO
+    if conn.vehicle.getIDCount() or conn.simulation.getPendingVehicles():
+      return 0
+    return int(steps)
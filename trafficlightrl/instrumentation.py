@@ -0,0 +1,121 @@
+import bisect
+import contextlib
+import time
+from collections import defaultdict
+
+
+# upper edges (in microseconds) of the latency histogram buckets; the last bucket catches everything slower
+LATENCY_BUCKETS_US = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+
+class Instrumentation:
+  """
+  Call counts and latencies of every TraCI call an env makes, broken down per method, per step and per env phase.
+
+  The env marks what it is doing with `with instrumentation.phase("get_state"): ...` and calls new_step() once per
+  env step; InstrumentedConnection reports each call through record(). Memory stays constant: per-method counters,
+  a fixed latency histogram per method and running per-step totals.
+  """
+
+  def __init__(self):
+    self.reset()
+
+  def reset(self):
+    self.current_phase = "other"
+    self.calls = defaultdict(int) # method -> count
+    self.total_time = defaultdict(float) # method -> seconds spent waiting on SUMO
+    self.histograms = defaultdict(lambda: [0] * (len(LATENCY_BUCKETS_US) + 1))
+    self.phase_calls = defaultdict(lambda: defaultdict(int)) # phase -> method -> count
+    self.phase_time = defaultdict(float) # phase -> wall-clock seconds (including the python work in between calls)
+
+    self.steps = 0
+    self.step_calls = 0 # calls made during the current step
+    self.max_step_calls = 0
+    self.total_calls = 0
+
+  def record(self, method, seconds):
+    self.calls[method] += 1
+    self.total_time[method] += seconds
+    self.histograms[method][bisect.bisect_left(LATENCY_BUCKETS_US, seconds * 1e6)] += 1
+    self.phase_calls[self.current_phase][method] += 1
+    self.step_calls += 1
+    self.total_calls += 1
+
+  def new_step(self):
+    self.max_step_calls = max(self.max_step_calls, self.step_calls)
+    self.step_calls = 0
+    self.steps += 1
+
+  @contextlib.contextmanager
+  def phase(self, name):
+    previous = self.current_phase
+    self.current_phase = name
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.phase_time[name] += time.perf_counter() - start
+      self.current_phase = previous
+
+  def summary(self):
+    """Plain dict (JSON-serializable) of everything recorded since the last reset()"""
+    bucket_names = [f"<{edge}us" for edge in LATENCY_BUCKETS_US] + [f">={LATENCY_BUCKETS_US[-1]}us"]
+    return {
+      "steps": self.steps,
+      "total_calls": self.total_calls,
+      "calls_per_step": self.total_calls / self.steps if self.steps else None,
+      "max_calls_per_step": max(self.max_step_calls, self.step_calls),
+      "calls": dict(self.calls),
+      "phase_calls": {phase: dict(calls) for phase, calls in self.phase_calls.items()},
+      "phase_time": dict(self.phase_time),
+      "latency": {
+        method: {
+          "total": self.total_time[method],
+          "mean": self.total_time[method] / self.calls[method],
+          "histogram": dict(zip(bucket_names, self.histograms[method]))
+        }
+        for method in self.calls
+      }
+    }
+
+
+class _InstrumentedDomain:
+  def __init__(self, domain, domain_name, instrumentation):
+    self._domain = domain
+    self._domain_name = domain_name
+    self._instrumentation = instrumentation
+
+  def __getattr__(self, name):
+    attr = getattr(self._domain, name)
+    if not callable(attr):
+      return attr
+    return _timed(attr, f"{self._domain_name}.{name}", self._instrumentation)
+
+
+class InstrumentedConnection:
+  """
+  Drop-in stand-in for the env's TraCI connection (or the libsumo module) that records every call it forwards.
+
+  Domains (vehicle, lane, trafficlight, simulation, route, edge, ...) are wrapped so calls are recorded as e.g.
+  "lane.getAllSubscriptionResults"; top-level calls such as simulationStep, load and close are recorded by name.
+  """
+
+  def __init__(self, conn, instrumentation):
+    self._conn = conn
+    self._instrumentation = instrumentation
+
+  def __getattr__(self, name):
+    attr = getattr(self._conn, name)
+    if callable(attr) and not isinstance(attr, type): # libsumo domains are classes, traci domains are instances
+      return _timed(attr, name, self._instrumentation)
+    return _InstrumentedDomain(attr, name, self._instrumentation)
+
+
+def _timed(fn, method, instrumentation):
+  def timed(*args, **kwargs):
+    start = time.perf_counter()
+    try:
+      return fn(*args, **kwargs)
+    finally:
+      instrumentation.record(method, time.perf_counter() - start)
+  return timed
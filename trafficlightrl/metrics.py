@@ -0,0 +1,25 @@
+class MetricRegistry:
+  """
+  Lazily evaluated metrics, computed at most once per simulation step.
+
+  Each metric is registered once as a zero-argument function (usually one of the env's calculate_* methods).
+  Nothing runs until someone asks for it with get(name); the value is then cached until new_step() is called,
+  so the reward and the episode info can share a metric without paying for it twice - and metrics nobody
+  asks for (including the logs they update as a side effect) are never computed.
+  """
+
+  def __init__(self):
+    self.metrics = {}
+    self.cache = {}
+
+  def register(self, name, metric_fn):
+    self.metrics[name] = metric_fn
+
+  def new_step(self):
+    # call right after every simulation step that the metrics should describe
+    self.cache = {}
+
+  def get(self, name):
+    if name not in self.cache:
+      self.cache[name] = self.metrics[name]()
+    return self.cache[name]
@@ -0,0 +1,51 @@
+import os
+import numpy as np
+
+
+# metadata of every network loaded in this process, keyed by the absolute path of its .sumocfg and the env's lanes
+_network_cache = {}
+
+
+class NetworkMetadata:
+  """
+  Static facts about a loaded network that never change during (or between) episodes.
+
+  Traffic light IDs, lane max speeds and lengths, the phases that serve each controlled lane and the spawn edges
+  that actually exist in the network are queried once when the network is first loaded (a traffic light's program
+  the first time it is asked for). Every later lookup is a plain dict access instead of a TraCI round-trip.
+  """
+
+  def __init__(self, conn, lanes, spawn_edges=()):
+    self.traffic_light_ids = list(conn.trafficlight.getIDList())
+
+    # the light that controls the env's lanes (a cropped or tiled network can hold more than one)
+    self.traffic_light_id = next(
+      (tls_id for tls_id in self.traffic_light_ids if set(conn.trafficlight.getControlledLanes(tls_id)) & set(lanes)),
+      self.traffic_light_ids[0] if self.traffic_light_ids else None
+    )
+
+    self.lane_max_speeds = {lane_id: conn.lane.getMaxSpeed(lane_id) for lane_id in lanes}
+    self.lane_lengths = {lane_id: conn.lane.getLength(lane_id) for lane_id in lanes}
+    self.lane_phases = {lane_id: np.array(lane_info["phases"], dtype=np.int64) for lane_id, lane_info in lanes.items()}
+
+    # only keep the start edges of edge_mapping that exist in this network
+    edges = set(conn.edge.getIDList())
+    self.spawn_edges = [edge for edge in spawn_edges if edge in edges]
+
+    self._programs = {}
+
+  def traffic_light_program(self, conn, traffic_light_id):
+    """The light's active program (its tlLogic in the network file) as a list of (state, duration) per phase"""
+    if traffic_light_id not in self._programs:
+      program_id = conn.trafficlight.getProgram(traffic_light_id)
+      logic = next(logic for logic in conn.trafficlight.getAllProgramLogics(traffic_light_id) if logic.programID == program_id)
+      self._programs[traffic_light_id] = [(phase.state, phase.duration) for phase in logic.phases]
+    return self._programs[traffic_light_id]
+
+
+def get_network_metadata(conn, sumo_config, lanes, spawn_edges=()):
+  """Returns the cached metadata for this network, building it from the live connection the first time"""
+  key = (os.path.abspath(sumo_config), tuple(lanes), tuple(spawn_edges)) # copies of a tiled network share the config
+  if key not in _network_cache:
+    _network_cache[key] = NetworkMetadata(conn, lanes, spawn_edges)
+  return _network_cache[key]
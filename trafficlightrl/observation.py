@@ -0,0 +1,202 @@
+import numpy as np
+from traci import constants as tc
+
+
+# Variables subscribed once per episode on every lane directly connected to the intersection
+# (static lane data such as the max speed comes from trafficlightrl.network instead)
+LANE_VARIABLES = [
+  tc.LAST_STEP_VEHICLE_ID_LIST,
+  tc.LAST_STEP_VEHICLE_NUMBER,
+  tc.LAST_STEP_VEHICLE_HALTING_NUMBER,
+  tc.VAR_WAITING_TIME # sum of the waiting times of all vehicles on the lane
+]
+
+# Variables subscribed on each vehicle the first time it shows up on one of those lanes
+VEHICLE_VARIABLES = [
+  tc.VAR_SPEED,
+  tc.VAR_WAITING_TIME
+]
+
+
+class SubscriptionObserver:
+  """
+  Collects the data behind SumoEnv.get_state through TraCI subscriptions instead of per-vehicle getter calls.
+
+  The lanes, the traffic light phase and the simulation time are subscribed once per episode (call subscribe()
+  after every traci.start / traci.load). Vehicles are subscribed the first time they appear on a controlled lane.
+  From then on SUMO sends every value back with the simulationStep() response, so update() only reads the
+  subscription results that are already on the client - the only extra round-trips are for newly arrived vehicles.
+
+  With a VehicleBookkeeper (trafficlightrl.vehicles), the bookkeeper's variables are added to the subscriptions and it
+  is fed from the same results on every update().
+
+  For one copy of a tiled network (trafficlightrl.tiling) only the vehicles whose ID starts with vehicle_prefix are
+  subscribed and recorded, and time() counts from time_origin, the simulation time the copy's episode started at.
+  """
+
+  lane_variables = LANE_VARIABLES
+
+  def __init__(self, lane_ids, speed_threshold=0.1, vehicle_variables=VEHICLE_VARIABLES, bookkeeper=None, vehicle_prefix=""):
+    self.lane_ids = list(lane_ids)
+    self.vehicle_prefix = vehicle_prefix
+    self.time_origin = 0
+    self.vehicle_variables = list(vehicle_variables)
+    self.simulation_variables = [tc.VAR_TIME, tc.VAR_DELTA_T]
+    self.bookkeeper = bookkeeper
+    if bookkeeper:
+      self.vehicle_variables += [v for v in bookkeeper.vehicle_variables if v not in self.vehicle_variables]
+      self.simulation_variables += [v for v in bookkeeper.simulation_variables if v not in self.simulation_variables]
+      self.lane_variables = self.lane_variables + [v for v in bookkeeper.lane_variables if v not in self.lane_variables]
+    self.speed_threshold = speed_threshold # vehicles with speed < 0.1 m/s are considered stopped
+    self.traffic_light_id = None
+
+    self.subscribed_vehicles = set()
+    self.lane_results = {}
+    self.vehicle_results = {}
+    self.traffic_light_results = {}
+    self.simulation_results = {}
+
+  def subscribe(self, conn, traffic_light_id):
+    # a fresh episode drops all of the old subscriptions on the SUMO side
+    self.traffic_light_id = traffic_light_id
+    self.subscribed_vehicles = set()
+
+    for lane_id in self.lane_ids:
+      conn.lane.subscribe(lane_id, self.lane_variables)
+    conn.trafficlight.subscribe(traffic_light_id, [tc.TL_CURRENT_PHASE])
+    conn.simulation.subscribe(self.simulation_variables)
+
+    if self.bookkeeper:
+      self.bookkeeper.reset()
+
+    self.update(conn)
+
+  def _subscribe_vehicles(self, conn, vehicle_ids):
+    # subscribe() answers with the current values right away
+    for vehicle_id in vehicle_ids:
+      if vehicle_id not in self.subscribed_vehicles and vehicle_id.startswith(self.vehicle_prefix):
+        conn.vehicle.subscribe(vehicle_id, self.vehicle_variables)
+        self.subscribed_vehicles.add(vehicle_id)
+
+  def update(self, conn):
+    """Pull this step's subscription results (call once per step, after traci.simulationStep())"""
+    self.lane_results = conn.lane.getAllSubscriptionResults()
+    self.traffic_light_results = conn.trafficlight.getSubscriptionResults(self.traffic_light_id)
+    self.simulation_results = conn.simulation.getSubscriptionResults()
+
+    # subscribe vehicles that just entered a controlled lane
+    for lane_id in self.lane_ids:
+      self._subscribe_vehicles(conn, self.lane_results[lane_id][tc.LAST_STEP_VEHICLE_ID_LIST])
+
+    self.vehicle_results = conn.vehicle.getAllSubscriptionResults()
+    if self.bookkeeper:
+      self.bookkeeper.update(self.simulation_results, self.vehicle_results, self.lane_results, self.lane_ids)
+
+  def phase(self):
+    return self.traffic_light_results[tc.TL_CURRENT_PHASE]
+
+  def time(self):
+    return self.simulation_results[tc.VAR_TIME] - self.time_origin
+
+  def step_length(self):
+    return self.simulation_results[tc.VAR_DELTA_T]
+
+  def vehicle_count(self, lane_id):
+    return self.lane_results[lane_id][tc.LAST_STEP_VEHICLE_NUMBER]
+
+  def waiting_time(self, lane_id):
+    return self.lane_results[lane_id][tc.VAR_WAITING_TIME]
+
+  def halting_number(self, lane_id):
+    return self.lane_results[lane_id][tc.LAST_STEP_VEHICLE_HALTING_NUMBER]
+
+  def lane_metrics(self, lane_id):
+    """Returns (number of vehicles, queue length, total wait time, average speed) for one lane"""
+    vehicle_ids = self.lane_results[lane_id][tc.LAST_STEP_VEHICLE_ID_LIST]
+    speeds = [self.vehicle_results[v_id][tc.VAR_SPEED] for v_id in vehicle_ids]
+
+    num_vehicles = len(vehicle_ids)
+    queue_length = sum(1 for speed in speeds if speed < self.speed_threshold)
+    total_wait_time = sum(self.vehicle_results[v_id][tc.VAR_WAITING_TIME] for v_id in vehicle_ids)
+    avg_speed = np.mean(speeds) if speeds else 0
+
+    return num_vehicles, queue_length, total_wait_time, avg_speed
+
+  def vehicle_ids(self, lane_ids=None):
+    """IDs of every vehicle currently on the given lanes (default: all controlled lanes), in lane order"""
+    lane_ids = self.lane_ids if lane_ids is None else lane_ids
+    return [v_id for lane_id in lane_ids for v_id in self.lane_results[lane_id][tc.LAST_STEP_VEHICLE_ID_LIST]]
+
+  def vehicle_values(self, vehicle_ids, variable):
+    """NumPy array of one subscribed vehicle variable (e.g. tc.VAR_SPEED), in the order of vehicle_ids"""
+    return np.array([self.vehicle_results[v_id][variable] for v_id in vehicle_ids], dtype=np.float64)
+
+
+class LaneAggregateObserver(SubscriptionObserver):
+  """
+  Same observation data as SubscriptionObserver, computed from lane-level aggregates only.
+
+  SUMO already keeps the halting number (vehicles slower than 0.1 m/s - the same threshold get_state uses),
+  the summed waiting time and the mean speed of every lane, so no vehicle is subscribed for the observation and the
+  per-step cost depends on the number of controlled lanes rather than on the number of queued cars (a bookkeeper,
+  if given, still subscribes each vehicle on the controlled lanes once for its own records).
+  """
+
+  lane_variables = LANE_VARIABLES[1:] + [tc.LAST_STEP_MEAN_SPEED] # the vehicle ID list is not needed
+
+  def update(self, conn):
+    self.lane_results = conn.lane.getAllSubscriptionResults()
+    self.traffic_light_results = conn.trafficlight.getSubscriptionResults(self.traffic_light_id)
+    self.simulation_results = conn.simulation.getSubscriptionResults()
+
+    if self.bookkeeper: # the bookkeeper adds the lanes' vehicle ID lists to the subscription
+      for lane_id in self.lane_ids:
+        self._subscribe_vehicles(conn, self.lane_results[lane_id][tc.LAST_STEP_VEHICLE_ID_LIST])
+      self.vehicle_results = conn.vehicle.getAllSubscriptionResults()
+      self.bookkeeper.update(self.simulation_results, self.vehicle_results, self.lane_results, self.lane_ids)
+
+  def lane_metrics(self, lane_id):
+    lane = self.lane_results[lane_id]
+    num_vehicles = lane[tc.LAST_STEP_VEHICLE_NUMBER]
+
+    # SUMO reports the lane's max speed as the mean speed of an empty lane; get_state uses 0 there
+    avg_speed = lane[tc.LAST_STEP_MEAN_SPEED] if num_vehicles else 0
+
+    return num_vehicles, lane[tc.LAST_STEP_VEHICLE_HALTING_NUMBER], lane[tc.VAR_WAITING_TIME], avg_speed
+
+
+class ObservationLayout:
+  """
+  Fixed layout of the lane-based observation, compiled once from the env's self.lanes table.
+
+  [phase, time since last phase change] followed by one row per lane:
+  [vehicles, queue length, wait time, avg speed, time since last visited, left, straight, right]
+  The one-hot lane types never change, so they are written into the buffer once here; get_state only fills the
+  dynamic columns of the preallocated float32 buffer (and hands out a copy of it).
+  """
+
+  num_lane_metrics = 5 # dynamic columns per lane
+  num_lane_type_features = 3 # [left, straight, right] "one-hot" encoding
+
+  def __init__(self, lanes, phases):
+    self.lane_ids = list(lanes)
+    self.phases = list(phases) # the phases tracked in last_phase_change_time, in that order
+
+    num_lanes = len(self.lane_ids)
+    self.size = 2 + num_lanes * (self.num_lane_metrics + self.num_lane_type_features)
+    self.buffer = np.zeros(self.size, dtype=np.float32)
+
+    # per-lane rows are a view into the buffer, so writing a column writes the observation directly
+    self.lane_rows = self.buffer[2:].reshape(num_lanes, self.num_lane_metrics + self.num_lane_type_features)
+    self.lane_rows[:, self.num_lane_metrics:] = [lanes[lane_id]["type"] for lane_id in self.lane_ids]
+
+    # lane x phase mask: which of the tracked phases serve each lane
+    self.lane_phase_mask = np.zeros((num_lanes, len(self.phases)), dtype=bool)
+    for i, lane_id in enumerate(self.lane_ids):
+      for phase in lanes[lane_id]["phases"]:
+        self.lane_phase_mask[i, self.phases.index(phase)] = True
+
+  def time_since_visited(self, last_phase_change_time):
+    """For every lane: seconds since one of its phases was last active, relative to the longest-waiting phase"""
+    phase_times = np.array([last_phase_change_time[phase] for phase in self.phases], dtype=np.float32)
+    return np.where(self.lane_phase_mask, phase_times, np.inf).min(axis=1) / phase_times.max()
@@ -0,0 +1,142 @@
+"""
+Streaming readers for SUMO's XML outputs (tripinfo, emission and summary output), producing SumoEnv episode metrics.
+
+Files are read once, sequentially, with ElementTree.iterparse; every record is dropped from the tree as soon as it
+has been folded into the running aggregates (see trafficlightrl.stats), so memory does not grow with the file (multi-hundred-MB emission
+outputs from long UofT runs included). .gz outputs are read directly.
+"""
+import gzip
+import xml.etree.ElementTree as ET
+
+from trafficlightrl.stats import PerVehicleStat
+
+
+# pollutant name (as in trafficlightrl.emissions) -> attribute of a tripinfo <emissions> / emission output <vehicle>
+TRIPINFO_POLLUTANTS = {"CO2": "CO2_abs", "NOx": "NOx_abs", "fuel": "fuel_abs"}
+EMISSION_POLLUTANTS = {"CO2": "CO2", "NOx": "NOx", "fuel": "fuel"}
+
+
+def _open_xml(path):
+  return gzip.open(path) if path.endswith(".gz") else open(path, "rb")
+
+
+def iter_records(path, tag):
+  """Yields each complete <tag> element of an output file; it (and anything before it) is freed once the caller moves on"""
+  with _open_xml(path) as f:
+    context = ET.iterparse(f, events=("start", "end"))
+    _, root = next(context)
+    depth = 0 # nesting below the root element
+    for event, element in context:
+      if event == "start":
+        depth += 1
+        continue
+
+      depth -= 1
+      if element.tag == tag:
+        yield element
+      if depth == 0:
+        root.clear() # a top-level record is done: drop it so the tree never grows
+
+
+def parse_tripinfo(path):
+  """
+  Per-vehicle totals from a tripinfo output (with the emissions device, CO2_abs etc. are included).
+
+  Returns (wait_time_stats, emission_stats): a PerVehicleStat over accumulated waiting time [s] and one per pollutant
+  over total emissions [mg]; a tripinfo record is written once a vehicle has arrived, so each one is final as soon as
+  it is read.
+  """
+  wait_time_stats = PerVehicleStat()
+  emission_stats = {pollutant: PerVehicleStat() for pollutant in TRIPINFO_POLLUTANTS}
+  for trip in iter_records(path, "tripinfo"):
+    vehicle_id = trip.get("id")
+    wait_time_stats.update(vehicle_id, float(trip.get("waitingTime")))
+    wait_time_stats.evict([vehicle_id])
+    emissions = trip.find("emissions")
+    if emissions is not None:
+      for pollutant, attribute in TRIPINFO_POLLUTANTS.items():
+        emission_stats[pollutant].update(vehicle_id, float(emissions.get(attribute, 0)))
+        emission_stats[pollutant].evict([vehicle_id])
+  return wait_time_stats, emission_stats
+
+
+def parse_summary(path):
+  """Mean of the per-step halting count and of the per-step mean speed from a summary output"""
+  steps = 0
+  total_halting = 0
+  total_speed = 0.0
+  for step in iter_records(path, "step"):
+    steps += 1
+    total_halting += int(step.get("halting"))
+    total_speed += max(float(step.get("meanSpeed")), 0) # SUMO writes -1 when no vehicle is running; the env uses 0
+
+  if not steps:
+    return None, None
+  return total_halting / steps, total_speed / steps
+
+
+def parse_emissions(path, step_length=None, lane_ids=None):
+  """
+  The env's own episode metrics, reconstructed from an emission output (one record per vehicle per time step).
+
+  - wait_time_stats: PerVehicleStat of the greatest (consecutive) waiting time of each vehicle, like the env's VehicleBookkeeper keeps it
+  - total_congestion_avg: mean number of stopped vehicles per step, leaving out those within a second of their departure
+    like calculate_congestion does (a vehicle departs at the first time step it is recorded in)
+  - total_speed_avg: mean over steps of the average vehicle speed
+  - emission_stats: per pollutant, PerVehicleStat of each vehicle's emissions integrated over time [mg]
+
+  With lane_ids (the env's controlled lanes), the per-vehicle values only cover the records on those lanes, as the
+  bookkeeper's do; congestion and speed stay network-wide. A vehicle missing from a time step (or, with lane_ids, off
+  the lanes) is done, so its values are final from then on.
+  step_length defaults to the spacing of the time steps in the file (1 s until the second step has been read).
+  """
+  wait_time_stats = PerVehicleStat("max")
+  emission_stats = {pollutant: PerVehicleStat("sum") for pollutant in EMISSION_POLLUTANTS}
+  steps = 0
+  total_stopped = 0
+  total_avg_speed = 0.0
+  previous_time = None
+  departures = {}
+  fixed_step_length = step_length is not None
+  lane_ids = set(lane_ids) if lane_ids is not None else None
+  step_length = step_length if fixed_step_length else 1.0
+
+  for timestep in iter_records(path, "timestep"):
+    time = float(timestep.get("time"))
+    if previous_time is not None and not fixed_step_length:
+      step_length = time - previous_time
+    previous_time = time
+
+    stopped = 0
+    speed_sum = 0.0
+    num_vehicles = 0
+    vehicle_ids = [] # the ones with per-vehicle values this step
+    for vehicle in timestep.iter("vehicle"):
+      vehicle_id = vehicle.get("id")
+      speed = float(vehicle.get("speed"))
+
+      num_vehicles += 1
+      speed_sum += speed
+      depart = departures.setdefault(vehicle_id, time)
+      if speed == 0 and time not in range(int(depart) - 1, int(depart) + 2):
+        stopped += 1
+      if lane_ids is not None and vehicle.get("lane") not in lane_ids:
+        continue
+      vehicle_ids.append(vehicle_id)
+      wait_time_stats.update(vehicle_id, float(vehicle.get("waiting")))
+      for pollutant, attribute in EMISSION_POLLUTANTS.items():
+        emission_stats[pollutant].update(vehicle_id, float(vehicle.get(attribute, 0)) * step_length)
+
+    wait_time_stats.retain(vehicle_ids)
+    for stats in emission_stats.values():
+      stats.retain(vehicle_ids)
+    steps += 1
+    total_stopped += stopped
+    total_avg_speed += speed_sum / num_vehicles if num_vehicles else 0
+
+  return {
+    "wait_time_stats": wait_time_stats,
+    "total_congestion_avg": total_stopped / steps if steps else None,
+    "total_speed_avg": total_avg_speed / steps if steps else None,
+    "emission_stats": emission_stats
+  }
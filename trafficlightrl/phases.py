@@ -0,0 +1,121 @@
+"""
+Traffic light actions as data: every (current phase, action) pair is compiled once into the list of phase changes
+it runs, and a single executor replaces the per-campus if/elif chains of setPhase / setPhaseDuration / skip_steps.
+"""
+
+HOLD = 99999 # phase duration that holds a green until the next action changes it
+CURRENT = object() # in a transition step: stay in the phase the light is in when the action is taken
+ANY = object() # as the from-phase of a transition: every phase without a transition of its own
+
+
+def clearance_transitions(action_phases, clearance, all_red=(), green_time=5):
+  """
+  Transitions for lights whose yellow sequence depends only on the phase being left.
+
+  clearance maps a (green) phase to the yellow steps that leave it, ANY covers every other phase; each action then
+  runs clearance[current phase] + all_red + its own green held for green_time seconds.
+  """
+  transitions = {}
+  for action, green in enumerate(action_phases):
+    for from_phase, steps in clearance.items():
+      transitions[(from_phase, action)] = list(steps) + list(all_red) + [(green, HOLD, green_time)]
+  return transitions
+
+
+def _is_green(state):
+  return "y" not in state.lower() and any(signal in "Gg" for signal in state)
+
+
+def program_transitions(program, action_phases, green_time=5):
+  """
+  Transitions derived from the light's own program (its tlLogic, as (state, duration) per phase).
+
+  From any phase, the program is followed towards the action's green phase: every yellow / all-red phase on the way
+  runs with its programmed duration until each link that is green now but not in the target green has seen one
+  (plus the all-red phases right after it), other green phases are skipped, and the target green is held for green_time.
+  """
+  num_phases = len(program)
+  transitions = {}
+  for from_phase, (from_state, _) in enumerate(program):
+    for action, green in enumerate(action_phases):
+      if from_phase == green:
+        continue
+      green_state = program[green][0]
+      pending = {link for link, signal in enumerate(from_state) if signal in "Gg" and green_state[link] not in "Gg"}
+
+      steps = []
+      phase = (from_phase + 1) % num_phases
+      while phase != green:
+        state, duration = program[phase]
+        all_red = not any(signal in "GgYyu" for signal in state)
+        if not _is_green(state) and (pending or (all_red and steps)):
+          steps.append((phase, duration, duration))
+          pending = {link for link in pending if state[link] in "Gg"}
+        elif not pending and steps:
+          break
+        phase = (phase + 1) % num_phases
+      transitions[(from_phase, action)] = steps + [(green, HOLD, green_time)]
+  return transitions
+
+
+class PhaseTransitionTable:
+  """
+  (current phase, action) -> the TraCI work that action does, compiled once per env.
+
+  transitions maps (from_phase, action) to a list of (phase, duration, time): switch to phase (CURRENT = keep the
+  current one), give it duration seconds and run the simulation for time seconds; without them the transitions are
+  derived from the program (program_transitions). An action whose green phase is already showing does nothing.
+  program is the light's tlLogic as (state, duration) per phase: setPhase() already starts a phase with its
+  programmed duration, so setPhaseDuration() is only sent when it differs.
+  Every time is in seconds; they are turned into simulation steps of step_length seconds here, once, rounding half up
+  (a 5 s green runs 6 s at step_length=2). A phase that would end before its rounded run time is given that run time
+  as its duration, so SUMO never moves on while the env still holds it.
+  """
+
+  def __init__(self, action_phases, program, transitions=None, step_length=1.0):
+    self.action_phases = list(action_phases)
+    if transitions is None:
+      transitions = program_transitions(program, self.action_phases)
+    phase_durations = [duration for _, duration in program]
+    num_phases = len(phase_durations)
+
+    self.table = []
+    for current_phase in range(num_phases):
+      row = []
+      for action, green in enumerate(self.action_phases):
+        steps = [] if current_phase == green else transitions.get((current_phase, action), transitions.get((ANY, action)))
+        if steps is None:
+          raise ValueError(f"no transition from phase {current_phase} for action {action}")
+        row.append(tuple(self._compile(steps, phase_durations, step_length)))
+      self.table.append(row)
+
+  @staticmethod
+  def _compile(steps, phase_durations, step_length):
+    for phase, duration, run_time in steps:
+      num_steps = max(1, int(run_time / step_length + 0.5))
+      if duration != HOLD:
+        duration = max(duration, num_steps * step_length)
+      if phase is CURRENT:
+        yield None, duration, num_steps
+        continue
+      if not 0 <= phase < len(phase_durations):
+        raise ValueError(f"phase {phase} is not in the traffic light program ({len(phase_durations)} phases)")
+      yield phase, (None if duration == phase_durations[phase] else duration), num_steps
+
+  def timeline(self, current_phase, action):
+    """The same transition as ([(step it starts at, phase, duration)], total steps), for lights that share a simulation"""
+    events = []
+    start = 0
+    for phase, duration, num_steps in self.table[current_phase][action]:
+      events.append((start, phase, duration))
+      start += num_steps
+    return events, start
+
+  def execute(self, conn, traffic_light_id, current_phase, action, skip_steps):
+    """Runs the transition for this action from current_phase; skip_steps(n) advances the simulation n steps"""
+    for phase, duration, num_steps in self.table[current_phase][action]:
+      if phase is not None:
+        conn.trafficlight.setPhase(traffic_light_id, phase)
+      if duration is not None:
+        conn.trafficlight.setPhaseDuration(traffic_light_id, duration)
+      skip_steps(num_steps)
@@ -0,0 +1,32 @@
+import os
+import tempfile
+
+
+class SnapshotReset:
+  """
+  Resets an episode by restoring a saved SUMO state instead of calling traci.load(), which re-parses the whole network.
+
+  The state is saved once, right after the network is first loaded (optionally after warmup_steps plain simulation
+  steps so that route-file traffic is already on the road), and every reset afterwards is a single
+  simulation.loadState() call. The warm-up does not spawn random cars, so the env's deployed_counter stays valid.
+  """
+
+  def __init__(self, label, warmup_steps=0):
+    self.warmup_steps = warmup_steps
+    self.state_file = os.path.join(tempfile.gettempdir(), f"{label}.state.xml")
+    self.saved = False
+
+  def save(self, conn):
+    for _ in range(self.warmup_steps):
+      conn.simulationStep()
+
+    conn.simulation.saveState(self.state_file)
+    self.saved = True
+
+  def restore(self, conn):
+    conn.simulation.loadState(self.state_file)
+
+  def cleanup(self):
+    if self.saved and os.path.exists(self.state_file):
+      os.remove(self.state_file)
+    self.saved = False
@@ -0,0 +1,175 @@
+"""
+Constant-memory accumulators for episode statistics.
+
+The envs used to keep every per-step value in a list and every vehicle in a dict for the whole episode (and, where
+reset() did not clear them, for the whole run). These keep a fixed amount of state instead: running moments, a
+fixed-bucket quantile sketch, and per-vehicle values only for the vehicles that are still being tracked.
+"""
+import bisect
+import math
+
+
+class RunningStats:
+  """Count, mean, variance (Welford), min and max of a stream of numbers"""
+
+  def __init__(self):
+    self.reset()
+
+  def reset(self):
+    self.count = 0
+    self.mean = 0.0
+    self._m2 = 0.0 # sum of squared differences from the running mean
+    self.min = None
+    self.max = None
+
+  def add(self, value, count=1):
+    # count > 1 adds the same value that many times in one update
+    self.count += count
+    delta = value - self.mean
+    self.mean += delta * count / self.count
+    self._m2 += delta * (value - self.mean) * count
+    self.min = value if self.min is None else min(self.min, value)
+    self.max = value if self.max is None else max(self.max, value)
+
+  def merge(self, other):
+    """Folds another RunningStats into this one (Chan et al. parallel update)"""
+    if not other.count:
+      return
+    if not self.count:
+      self.count, self.mean, self._m2, self.min, self.max = other.count, other.mean, other._m2, other.min, other.max
+      return
+    count = self.count + other.count
+    delta = other.mean - self.mean
+    self.mean += delta * other.count / count
+    self._m2 += other._m2 + delta * delta * self.count * other.count / count
+    self.count = count
+    self.min = min(self.min, other.min)
+    self.max = max(self.max, other.max)
+
+  @property
+  def variance(self):
+    return self._m2 / self.count if self.count else 0.0
+
+  @property
+  def std(self):
+    return math.sqrt(self.variance)
+
+  def copy(self):
+    stats = RunningStats()
+    stats.merge(self)
+    return stats
+
+
+class QuantileSketch:
+  """
+  Approximate quantiles of non-negative values from a fixed set of geometric buckets.
+
+  Bucket edges grow by `growth` from `minimum` up to `maximum`, so a quantile is off by at most that relative factor
+  (10% by default) whatever the number of values; zero and values below `minimum` share the first bucket and values
+  above `maximum` the last one.
+  """
+
+  def __init__(self, minimum=0.1, maximum=1e5, growth=1.1):
+    num_edges = int(math.ceil(math.log(maximum / minimum, growth))) + 1
+    self.edges = [minimum * growth ** i for i in range(num_edges)]
+    self.reset()
+
+  def reset(self):
+    self.counts = [0] * (len(self.edges) + 1)
+    self.count = 0
+
+  def add(self, value):
+    self.counts[bisect.bisect_left(self.edges, value)] += 1
+    self.count += 1
+
+  def merge(self, other):
+    self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+    self.count += other.count
+
+  def quantile(self, q):
+    """Upper edge of the bucket holding the q-th quantile (q in [0, 1]), None while empty"""
+    if not self.count:
+      return None
+    rank = q * (self.count - 1)
+    seen = 0
+    for i, bucket_count in enumerate(self.counts):
+      seen += bucket_count
+      if seen > rank:
+        if i == 0: # zero (or below minimum)
+          return 0.0
+        return self.edges[min(i, len(self.edges) - 1)]
+    return self.edges[-1]
+
+  def copy(self):
+    sketch = QuantileSketch.__new__(QuantileSketch)
+    sketch.edges = self.edges
+    sketch.counts = list(self.counts)
+    sketch.count = self.count
+    return sketch
+
+
+class PerVehicleStat:
+  """
+  One number per vehicle (its greatest value, its last value with mode="last" or the sum of its values with
+  mode="sum"), aggregated over vehicles.
+
+  Only the vehicles still being tracked are held in memory: once a vehicle is evicted (it arrived, or left the lanes
+  being watched) its value is final and is folded into `stats` and `sketch`, and its entry is dropped.
+  """
+
+  def __init__(self, mode="max", quantiles=(0.5, 0.9, 0.99)):
+    self.mode = mode
+    self.quantiles = quantiles
+    self.active = {} # vehicle_id -> value so far
+    self.stats = RunningStats()
+    self.sketch = QuantileSketch()
+
+  def reset(self):
+    self.active = {}
+    self.stats.reset()
+    self.sketch.reset()
+
+  def update(self, vehicle_id, value):
+    if vehicle_id in self.active:
+      if self.mode == "max":
+        value = max(self.active[vehicle_id], value)
+      elif self.mode == "sum":
+        value += self.active[vehicle_id]
+    self.active[vehicle_id] = value
+
+  def evict(self, vehicle_ids):
+    """Finalizes the given vehicles (ids that are not tracked are ignored)"""
+    for vehicle_id in vehicle_ids:
+      value = self.active.pop(vehicle_id, None)
+      if value is not None:
+        self.stats.add(value)
+        self.sketch.add(value)
+
+  def retain(self, vehicle_ids):
+    """Finalizes every tracked vehicle that is not in vehicle_ids"""
+    vehicle_ids = set(vehicle_ids)
+    self.evict([vehicle_id for vehicle_id in self.active if vehicle_id not in vehicle_ids])
+
+  def total(self):
+    """Sum over every vehicle seen since the last reset"""
+    return self.stats.mean * self.stats.count + sum(self.active.values())
+
+  def mean(self):
+    """Mean over every vehicle seen since the last reset (cheap enough to call every step), 0 if there were none"""
+    count = self.stats.count + len(self.active)
+    return (self.stats.mean * self.stats.count + sum(self.active.values())) / count if count else 0
+
+  def summary(self):
+    """Plain dict over every vehicle seen since the last reset (finalized and still tracked), None if there were none"""
+    stats = self.stats.copy()
+    sketch = self.sketch.copy()
+    for value in self.active.values():
+      stats.add(value)
+      sketch.add(value)
+
+    if not stats.count:
+      return None
+    summary = {"count": stats.count, "mean": stats.mean, "std": stats.std, "min": stats.min, "max": stats.max}
+    for q in self.quantiles:
+      summary[f"p{q * 100:g}"] = sketch.quantile(q)
+    return summary
@@ -0,0 +1,165 @@
+import gymnasium
+import numpy as np
+from stable_baselines3.common.vec_env import VecEnv
+
+from trafficlightrl.backend import connect, new_label
+from trafficlightrl.tiling import tile_network, tile_prefix
+
+
+# env options that need a simulation (or route files) of their own, so a copy on a shared network cannot use them
+UNSUPPORTED_OPTIONS = ("use_gui", "use_snapshot", "use_sumo_demand", "use_decision_points", "use_idle_fast_forward", "use_instrumentation")
+
+
+class TiledVecEnv(VecEnv):
+  """
+  stable-baselines3 vectorized env with `copies` independent copies of a campus SumoEnv, all simulated by one SUMO process.
+
+  The env's network is tiled into disconnected copies (tile_network) and one env per copy runs on it with its lane,
+  edge, traffic light and random car IDs prefixed (the env's tile_prefix argument), so each copy spawns its own cars
+  and has its own observation, reward, episode statistics and done. A single simulationStep() advances every copy, so
+  the per-process cost (and on libsumo, the one simulation per process limit) is shared by all of them.
+
+  Works with the lane-based campus envs (McMaster, Queens, Waterloo, Western). The actions of one step run side by
+  side: every copy's transition (yellow / all-red, see PhaseTransitionTable.timeline) starts at once, and the copies
+  with a shorter transition hold their new green until the longest one is done. A copy that is done starts its next
+  episode right away inside the running simulation (its cars are removed and its light is reset), as stable-baselines3
+  expects; reset() reloads the whole simulation. env_kwargs go to every copy (e.g. use_random=True, spawn_rate=0.3,
+  crop_radius=150 - crop first, so the copies stay small).
+  """
+
+  def __init__(self, env_class, copies, spacing=500.0, label=None, **env_kwargs):
+    for option in UNSUPPORTED_OPTIONS:
+      if env_kwargs.get(option):
+        raise ValueError(f"{option} is not supported on a tiled network")
+    env_kwargs = dict(env_kwargs, use_gui=False)
+
+    # tile the network the env would run on by itself (after crop_radius and the network artifact cache)
+    template = env_class(**env_kwargs)
+    self.sumo_config = tile_network(template.sumo_config, copies, spacing)
+    template.close()
+
+    env_kwargs = dict(env_kwargs, crop_radius=None, use_network_cache=False)
+    self.envs = [env_class(tile_prefix=tile_prefix(copy), **env_kwargs) for copy in range(copies)]
+    for copy, env in enumerate(self.envs):
+      env.sumo_config = self.sumo_config
+      # episode n of copy k is the env's episode k + n * copies, so with demand_seed every copy gets cars of its own
+      env.episode_count = copy
+
+    super().__init__(copies, self.envs[0].observation_space, self.envs[0].action_space)
+    self.label = label if label else new_label("tiled")
+    self.sumo = None
+    self.actions = None
+
+  def _reset_copy(self, copy, running, first=False):
+    # new episode for one copy; with running=True the simulation carries on (the other copies are mid-episode)
+    env = self.envs[copy]
+    if running:
+      vehicle_ids = list(self.sumo.vehicle.getIDList()) + list(self.sumo.simulation.getPendingVehicles())
+      for vehicle_id in [v_id for v_id in vehicle_ids if v_id.startswith(env.tile_prefix)]:
+        try:
+          if vehicle_id in env.observer.subscribed_vehicles: # SUMO keeps the subscription of a removed vehicle and fails on it
+            self.sumo.vehicle.unsubscribe(vehicle_id)
+          self.sumo.vehicle.remove(vehicle_id)
+        except env.backend.TraCIException: # already left the network
+          pass
+      env.observer.time_origin = self.sumo.simulation.getTime()
+    else:
+      env.observer.time_origin = 0
+
+    if not first:
+      env.episode_count += self.num_envs
+    env.deployed_counter = 0 if env.use_random else 1
+    env.congestion_stats.reset()
+    env.speed_stats.reset()
+    env.attach_simulation(self.sumo) # light back on phase 0, this episode's schedule, fresh subscriptions and records
+    return env.get_state()
+
+  def seed(self, seed=None):
+    # seeds every copy's random generator (copy i gets seed + i) right away, and makes seed the demand_seed of every
+    # copy: the live spawning draws from the global random module, so from the next episode on the cars replay the
+    # cached schedules instead (episode n of copy k uses seed + k + n * copies, see __init__)
+    if seed is None:
+      seed = int(np.random.randint(0, np.iinfo(np.uint32).max, dtype=np.uint32))
+    for copy, env in enumerate(self.envs):
+      gymnasium.Env.reset(env, seed=seed + copy)
+      env.demand_seed = seed
+    return [seed + copy for copy in range(self.num_envs)]
+
+  def reset(self):
+    first = self.sumo is None
+    if first:
+      env = self.envs[0]
+      self.sumo = connect(env.backend, [env.sumo_binary, "--start"] + env.simulation_args(), label=self.label)
+    else: # every copy ends its episode together
+      self.sumo.load(self.envs[0].simulation_args())
+    return np.stack([self._reset_copy(copy, running=False, first=first) for copy in range(self.num_envs)])
+
+  def step_async(self, actions):
+    self.actions = actions
+
+  def step_wait(self):
+    # every copy's transition as phase changes at a given step of this env step
+    changes = {}
+    num_steps = 0
+    for env, action in zip(self.envs, self.actions):
+      if not env.use_actions:
+        continue
+      events, total_steps = env.transition_table.timeline(env.observer.phase(), int(action))
+      for start, phase, duration in events:
+        changes.setdefault(start, []).append((env.traffic_light_id, phase, duration))
+      num_steps = max(num_steps, total_steps)
+
+    # the transition steps, then the env step's own simulation step
+    for step in range(num_steps + 1):
+      for traffic_light_id, phase, duration in changes.get(step, ()):
+        if phase is not None:
+          self.sumo.trafficlight.setPhase(traffic_light_id, phase)
+        if duration is not None:
+          self.sumo.trafficlight.setPhaseDuration(traffic_light_id, duration)
+      for env in self.envs:
+        if env.use_random:
+          env.spawn_cars()
+      self.sumo.simulationStep()
+      if step < num_steps:
+        for env in self.envs: # vehicles departing in this step are only reported now
+          env.observer.update(self.sumo)
+
+    observations, rewards, dones, infos = [], [], [], []
+    for copy, env in enumerate(self.envs):
+      env.metrics.new_step()
+      observation = env.get_state()
+      reward = env.calculate_reward()
+      for metric_name in env.info_metrics:
+        env.metrics.get(metric_name)
+      done = env.is_done()
+      info = env.step_info(done)
+      if done:
+        info["terminal_observation"] = observation
+        observation = self._reset_copy(copy, running=True)
+
+      observations.append(observation)
+      rewards.append(reward)
+      dones.append(done)
+      infos.append(info)
+
+    return np.stack(observations), np.array(rewards, dtype=np.float32), np.array(dones), infos
+
+  def close(self):
+    if self.sumo is not None:
+      self.sumo.close()
+      self.sumo = None
+    for env in self.envs:
+      env.close()
+
+  def get_attr(self, attr_name, indices=None):
+    return [getattr(self.envs[i], attr_name) for i in self._get_indices(indices)]
+
+  def set_attr(self, attr_name, value, indices=None):
+    for i in self._get_indices(indices):
+      setattr(self.envs[i], attr_name, value)
+
+  def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+    return [getattr(self.envs[i], method_name)(*method_args, **method_kwargs) for i in self._get_indices(indices)]
+
+  def env_is_wrapped(self, wrapper_class, indices=None):
+    return [False for _ in self._get_indices(indices)]
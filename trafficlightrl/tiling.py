@@ -0,0 +1,86 @@
+import os
+import shutil
+import subprocess
+import xml.etree.ElementTree as ET
+import sumolib
+
+from trafficlightrl.cache import cache_dir, content_hash
+from trafficlightrl.demand import config_inputs
+
+
+def tile_prefix(copy):
+  """Prefix of every edge, lane, junction, traffic light and random car ID of one copy of a tiled network"""
+  return f"t{copy}_"
+
+
+def tile_network(sumo_config, copies, spacing=500.0):
+  """
+  .sumocfg of a network holding `copies` disconnected copies of the config's network side by side, built once and cached.
+
+  Copy k is the original network with every ID prefixed by tile_prefix(k), shifted east by k times its width plus
+  spacing metres (netconvert --prefix / --offset.x), and the copies are merged into one network file. One SUMO process
+  then simulates every copy in each step; TiledVecEnv runs one campus env per copy on it. The config keeps the
+  original's options but loads none of its route or additional files (their IDs would not match any copy), so the
+  only traffic is the random cars each copy spawns. Crop the network first (crop_network) to keep the copies small.
+  The result is keyed on the network, the config, copies and spacing under cache_dir("networks").
+  """
+  net_file, _ = config_inputs(sumo_config)
+  with open(net_file, "rb") as f:
+    net_bytes = f.read()
+  with open(sumo_config, "rb") as f:
+    config_bytes = f.read()
+  key = content_hash(net_bytes, config_bytes, copies, spacing)
+
+  name = os.path.splitext(os.path.basename(sumo_config))[0]
+  directory = os.path.join(cache_dir("networks"), f"{name}_tiled{copies}_{key}")
+  config_file = os.path.join(directory, f"{name}.sumocfg")
+  if os.path.exists(config_file):
+    return config_file
+
+  # build in a private directory first so concurrent workers never load a half-written network
+  tmp_directory = f"{directory}.{os.getpid()}.tmp"
+  os.makedirs(tmp_directory, exist_ok=True)
+  try:
+    (min_x, _), (max_x, _) = sumolib.net.readNet(net_file).getBBoxXY()
+    width = max_x - min_x
+
+    netconvert = sumolib.checkBinary("netconvert")
+    copy_files = []
+    for copy in range(copies):
+      copy_file = os.path.join(tmp_directory, f"copy{copy}.net.xml")
+      subprocess.run([
+        netconvert, "-s", net_file,
+        "--prefix", tile_prefix(copy),
+        "--offset.x", str(copy * (width + spacing)),
+        "-o", copy_file,
+        "--no-warnings", "true"
+      ], check=True, stdout=subprocess.DEVNULL)
+      copy_files.append(copy_file)
+
+    subprocess.run([
+      netconvert, "-s", ",".join(copy_files),
+      "-o", os.path.join(tmp_directory, f"{name}.net.xml"),
+      "--no-warnings", "true"
+    ], check=True, stdout=subprocess.DEVNULL)
+    for copy_file in copy_files:
+      os.remove(copy_file)
+
+    # the original options with the tiled network as the only input (relative, so the directory can be moved into place)
+    tree = ET.parse(sumo_config)
+    root = tree.getroot()
+    for parent in list(root.iter()):
+      for element in list(parent):
+        if element.tag == "net-file":
+          element.set("value", f"{name}.net.xml")
+        elif element.tag in ("route-files", "additional-files", "gui-settings-file"):
+          parent.remove(element)
+    tree.write(os.path.join(tmp_directory, f"{name}.sumocfg"), encoding="UTF-8", xml_declaration=True)
+
+    try:
+      os.rename(tmp_directory, directory)
+    except OSError: # another worker finished the same network first
+      pass
+  finally:
+    if os.path.exists(tmp_directory):
+      shutil.rmtree(tmp_directory)
+  return config_file
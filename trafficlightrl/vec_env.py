@@ -0,0 +1,38 @@
+def make_vec_env(env_class, n_envs, use_subprocess=True, **env_kwargs):
+  """
+  Builds a stable-baselines3 vectorized env with n_envs copies of a campus SumoEnv.
+
+  With use_subprocess=True every copy lives in its own SubprocVecEnv worker with its own SUMO process,
+  so rollouts are collected on n_envs cores at once. Each env opens its own labelled TraCI connection,
+  so the copies never fight over a port or the global traci connection.
+
+  env_class has to be importable by the workers (e.g. `from simulate import SumoEnv`), and env_kwargs
+  are passed to every copy, e.g. make_vec_env(SumoEnv, 8, use_random=True, use_actions=True).
+  With use_subprocess=False all copies share one process, where libsumo can only hold a single simulation,
+  so more than one copy always runs on traci there.
+  """
+  from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv
+
+  if not use_subprocess and n_envs > 1:
+    env_kwargs = dict(env_kwargs, use_libsumo=False)
+
+  def make_env():
+    return env_class(**env_kwargs)
+
+  env_fns = [make_env for _ in range(n_envs)]
+  if use_subprocess:
+    return SubprocVecEnv(env_fns)
+  return DummyVecEnv(env_fns)
+
+
+def make_tiled_vec_env(env_class, copies, spacing=500.0, **env_kwargs):
+  """
+  Vectorized env with `copies` copies of a campus SumoEnv on one tiled network, all in a single SUMO process
+  (see TiledVecEnv), e.g. make_tiled_vec_env(SumoEnv, 16, use_random=True, crop_radius=150).
+
+  One simulation step advances every copy, so it collects copies samples per step on one core, where make_vec_env
+  pays for a SUMO process per copy.
+  """
+  from trafficlightrl.tiled_vec_env import TiledVecEnv
+
+  return TiledVecEnv(env_class, copies, spacing, **env_kwargs)
@@ -0,0 +1,58 @@
+from traci import constants as tc
+
+from trafficlightrl.emissions import EmissionAccounting
+from trafficlightrl.stats import PerVehicleStat
+
+
+class VehicleBookkeeper:
+  """
+  Per-vehicle episode records (greatest waiting time, emissions integrated over time) of the vehicles on the
+  controlled lanes.
+
+  The observer it is handed to (SubscriptionObserver(..., bookkeeper=...)) resets it on every subscribe(), adds
+  lane_variables (the lanes' vehicle ID lists and emission rates) to its lane subscription and subscribes
+  vehicle_variables on each vehicle the first time it shows up on a controlled lane; the values then come back with
+  every simulationStep() response. Each update() only visits the vehicles on the controlled lanes - the ones the
+  observation reads anyway - not every vehicle in the network. A vehicle's record is finalized and dropped from memory
+  in the step it leaves the lanes (or arrives), so the only extra TraCI calls are one subscribe() per vehicle that
+  enters them. The emission rates of the controlled lanes are integrated alongside, see EmissionAccounting.
+  """
+
+  simulation_variables = [tc.VAR_DELTA_T]
+
+  def __init__(self, emissions=None):
+    self.emissions = emissions if emissions else EmissionAccounting()
+    self.vehicle_variables = [tc.VAR_WAITING_TIME] + self.emissions.variables
+    self.lane_variables = [tc.LAST_STEP_VEHICLE_ID_LIST] + self.emissions.variables
+
+    self.active = set() # vehicles on the controlled lanes in the last update
+    self.last_time = None # simulation time of the last update (the observer may update twice in one step)
+    self.wait_time_stats = PerVehicleStat("max") # greatest (consecutive) waiting time of each vehicle [s]
+
+  def reset(self):
+    self.active = set()
+    self.last_time = None
+    self.wait_time_stats.reset()
+    self.emissions.reset()
+
+  def update(self, simulation_results, vehicle_results, lane_results, lane_ids):
+    """Accumulates this step's values of the vehicles on lane_ids and of the lanes, then finalizes the vehicles that left them"""
+    if simulation_results[tc.VAR_TIME] == self.last_time:
+      return
+    self.last_time = simulation_results[tc.VAR_TIME]
+
+    step_length = simulation_results[tc.VAR_DELTA_T]
+    on_lanes = set()
+    for lane_id in lane_ids:
+      for vehicle_id in lane_results[lane_id][tc.LAST_STEP_VEHICLE_ID_LIST]:
+        values = vehicle_results.get(vehicle_id)
+        if values:
+          self.wait_time_stats.update(vehicle_id, values[tc.VAR_WAITING_TIME])
+          self.emissions.add_vehicle(vehicle_id, values, step_length)
+          on_lanes.add(vehicle_id)
+    self.emissions.add_lanes(lane_results, lane_ids, step_length)
+
+    left = self.active - on_lanes
+    self.wait_time_stats.evict(left)
+    self.emissions.finalize(left)
+    self.active = on_lanes